@@ -1,22 +1,40 @@
-from argparse import ArgumentParser
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 from nmigen import *
-from shared.board.fpga_dev_board import FpgaDevBoard
+from shared.cli import designParser, boardAction
 from shared.clockDiv import ClockDiv
-from nmigen.back.pysim import Simulator, Delay
+from shared.resources import printUsage
+from shared.simPlatform import SimPlatform
+from shared.timebase import Timebase
+from shared.waveform import traceVcd, addTraceArgs
+from nmigen.back.pysim import Simulator, Delay, Settle
 
 
 class BinaryToDecimalConverter(Elaboratable):
-    def __init__(self):
+    def __init__(self, onChange=True):
         self.i_value = Signal(16)
         self.o_thousands = Signal(4)
         self.o_hundreds = Signal(4)
         self.o_tens = Signal(4)
         self.o_ones = Signal(4)
 
+        # handshake: i_valid com o_ready aceita o valor, o_valid fica em 1
+        # por um ciclo quando os digitos sao atualizados
+        self.i_valid = Signal()
+        self.o_ready = Signal()
+        self.o_valid = Signal()
+        self.onChange = onChange
+
     def elaborate(self, platform):
         m = Module()
 
+        start = Signal()
+        m.d.sync += self.o_valid.eq(0)
+
         value = Signal(16)
         register = Signal(32)
         thousands = Signal(4)
@@ -27,7 +45,14 @@ class BinaryToDecimalConverter(Elaboratable):
 
         with m.FSM():
             with m.State('IDLE'):
-                with m.If(value != self.i_value):
+                m.d.comb += self.o_ready.eq(1)
+
+                if (self.onChange):
+                    m.d.comb += start.eq(self.i_valid | (value != self.i_value))
+                else:
+                    m.d.comb += start.eq(self.i_valid)
+
+                with m.If(start):
                     m.d.sync += register.eq(self.i_value)
                     m.d.sync += value.eq(self.i_value)
                     m.d.sync += counter.eq(0)
@@ -76,15 +101,127 @@ class BinaryToDecimalConverter(Elaboratable):
                 m.d.sync += self.o_hundreds.eq(register[24:28])
                 m.d.sync += self.o_tens.eq(register[20:24])
                 m.d.sync += self.o_ones.eq(register[16:20])
+                m.d.sync += self.o_valid.eq(1)
                 m.next = 'IDLE'
 
         return m
 
 
+class PipelinedBinaryToDecimal(Elaboratable):
+    # double dabble desenrolado: um estagio por bit, aceita um valor novo
+    # a cada ciclo e entrega os digitos BCD `latency` ciclos depois
+    def __init__(self, width=16, bitsPerStage=1):
+        self.width = width
+        self.bitsPerStage = bitsPerStage
+        self.digits = len(str(2 ** width - 1))
+        self.latency = -(-width // bitsPerStage)
+
+        self.i_value = Signal(width)
+        self.i_valid = Signal()
+        self.o_bcd = Signal(4 * self.digits)  # digito menos significativo embaixo
+        self.o_valid = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        bcd = []
+        value = self.i_value
+        valid = self.i_valid
+
+        for n in range(self.width):
+            # soma 3 nos digitos >= 5 e desloca o proximo bit para dentro
+            adjusted = [Mux(digit >= 5, digit + 3, digit)[:4] for digit in bcd]
+            shifted = Cat(value[self.width - 1 - n], *adjusted, Const(0, 4))
+
+            # depois de n + 1 bits o valor cabe em menos digitos
+            digits = len(str(2 ** (n + 1) - 1))
+            bcd = [shifted[4 * i:4 * i + 4] for i in range(digits)]
+
+            if ((n + 1) % self.bitsPerStage == 0 or n == self.width - 1):
+                stageBcd = [Signal(4, name="bcd{}_{}".format(n, i)) for i in range(digits)]
+                stageValue = Signal(self.width, name="value{}".format(n))
+                stageValid = Signal(name="valid{}".format(n))
+                m.d.sync += [
+                    Cat(*stageBcd).eq(Cat(*bcd)),
+                    stageValue.eq(value),
+                    stageValid.eq(valid)
+                ]
+                bcd, value, valid = stageBcd, stageValue, stageValid
+
+        m.d.comb += [
+            self.o_bcd.eq(Cat(*bcd)),
+            self.o_valid.eq(valid)
+        ]
+
+        return m
+
+
+class BinaryToDecimalArbiter(Elaboratable):
+    # um unico BinaryToDecimalConverter atendendo varios clientes em
+    # round robin. cada cliente tem sua copia dos digitos em o_bcd,
+    # atualizada junto com o pulso em o_valid
+    def __init__(self, clients=2):
+        self.clients = clients
+
+        self.i_value = [Signal(16, name="i_value{}".format(i)) for i in range(clients)]
+        self.i_valid = [Signal(name="i_valid{}".format(i)) for i in range(clients)]
+        self.o_ready = [Signal(name="o_ready{}".format(i)) for i in range(clients)]
+        self.o_bcd = [Signal(16, name="o_bcd{}".format(i)) for i in range(clients)]
+        self.o_valid = [Signal(name="o_valid{}".format(i)) for i in range(clients)]
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.converter = converter = BinaryToDecimalConverter(onChange=False)
+
+        grant = Signal(max=self.clients)
+        values = Array(self.i_value)
+        bcd = Cat(converter.o_ones, converter.o_tens,
+                  converter.o_hundreds, converter.o_thousands)
+
+        m.d.comb += converter.i_value.eq(values[grant])
+        m.d.sync += [valid.eq(0) for valid in self.o_valid]
+
+        with m.FSM():
+            with m.State('IDLE'):
+                # o cliente logo depois do ultimo atendido tem prioridade
+                with m.Switch(grant):
+                    for last in range(self.clients):
+                        with m.Case(last):
+                            for offset in range(self.clients):
+                                client = (last + 1 + offset) % self.clients
+                                cond = m.If if offset == 0 else m.Elif
+                                with cond(self.i_valid[client]):
+                                    m.d.sync += grant.eq(client)
+                                    m.next = 'START'
+
+            with m.State('START'):
+                m.d.comb += converter.i_valid.eq(1)
+                with m.Switch(grant):
+                    for client in range(self.clients):
+                        with m.Case(client):
+                            m.d.comb += self.o_ready[client].eq(1)
+                m.next = 'CONVERT'
+
+            with m.State('CONVERT'):
+                with m.If(converter.o_valid):
+                    with m.Switch(grant):
+                        for client in range(self.clients):
+                            with m.Case(client):
+                                m.d.sync += [
+                                    self.o_valid[client].eq(1),
+                                    self.o_bcd[client].eq(bcd)
+                                ]
+                    m.next = 'IDLE'
+
+        return m
+
+
 class BcdTo7Segment(Elaboratable):
-    def __init__(self):
+    def __init__(self, hexDigits=False):
         self.i_bcd = Signal(4)
         self.o_7seg = Signal(8)
+        self.hexDigits = hexDigits
 
     def elaborate(self, platform):
         m = Module()
@@ -111,14 +248,29 @@ class BcdTo7Segment(Elaboratable):
             with m.Case(0b1001):
                 m.d.comb += self.o_7seg.eq(0b11101111)
 
+            if (self.hexDigits):
+                with m.Case(0b1010):
+                    m.d.comb += self.o_7seg.eq(0b11110111)
+                with m.Case(0b1011):
+                    m.d.comb += self.o_7seg.eq(0b11111100)
+                with m.Case(0b1100):
+                    m.d.comb += self.o_7seg.eq(0b10111001)
+                with m.Case(0b1101):
+                    m.d.comb += self.o_7seg.eq(0b11011110)
+                with m.Case(0b1110):
+                    m.d.comb += self.o_7seg.eq(0b11111001)
+                with m.Case(0b1111):
+                    m.d.comb += self.o_7seg.eq(0b11110001)
+
         return m
 
 
 class SevenSegmentsDisplay(Elaboratable):
-    def __init__(self):
+    def __init__(self, sharedDecoder=True):
         self.i_value = Signal(16)
         self.o_digits = Signal(4)
         self.o_segments = Signal(8)
+        self.sharedDecoder = sharedDecoder
 
     def elaborate(self, platform):
         m = Module()
@@ -126,19 +278,10 @@ class SevenSegmentsDisplay(Elaboratable):
         digitCounter = Signal(4, reset=0b1000)
         clockDiv = ClockDiv(150000)  # 196Hz ~5ms
         bcdConverter = BinaryToDecimalConverter()
-        thousandsConverter = BcdTo7Segment()
-        hundredesConverter = BcdTo7Segment()
-        tensConverter = BcdTo7Segment()
-        onesConverter = BcdTo7Segment()
 
-        m.submodules += clockDiv, bcdConverter, thousandsConverter, hundredesConverter, tensConverter, onesConverter
+        m.submodules += clockDiv, bcdConverter
 
         m.d.comb += [
-            thousandsConverter.i_bcd.eq(bcdConverter.o_thousands),
-            hundredesConverter.i_bcd.eq(bcdConverter.o_hundreds),
-            tensConverter.i_bcd.eq(bcdConverter.o_tens),
-            onesConverter.i_bcd.eq(bcdConverter.o_ones),
-
             bcdConverter.i_value.eq(self.i_value),
 
             self.o_digits.eq(digitCounter)
@@ -147,15 +290,170 @@ class SevenSegmentsDisplay(Elaboratable):
         with m.If(clockDiv.o_clk):
             m.d.sync += digitCounter.eq(Cat(digitCounter[1:], digitCounter[0]))
 
-        with m.Switch(digitCounter):
-            with m.Case(0b1000):
-                m.d.sync += self.o_segments.eq(thousandsConverter.o_7seg)
-            with m.Case(0b0100):
-                m.d.sync += self.o_segments.eq(hundredesConverter.o_7seg)
-            with m.Case(0b0010):
-                m.d.sync += self.o_segments.eq(tensConverter.o_7seg)
-            with m.Default():
-                m.d.sync += self.o_segments.eq(onesConverter.o_7seg)
+        if (self.sharedDecoder):
+            # so um digito aceso por vez: escolhe o nibble e decodifica uma vez
+            decoder = BcdTo7Segment()
+            m.submodules += decoder
+
+            with m.Switch(digitCounter):
+                with m.Case(0b1000):
+                    m.d.comb += decoder.i_bcd.eq(bcdConverter.o_thousands)
+                with m.Case(0b0100):
+                    m.d.comb += decoder.i_bcd.eq(bcdConverter.o_hundreds)
+                with m.Case(0b0010):
+                    m.d.comb += decoder.i_bcd.eq(bcdConverter.o_tens)
+                with m.Default():
+                    m.d.comb += decoder.i_bcd.eq(bcdConverter.o_ones)
+
+            m.d.sync += self.o_segments.eq(decoder.o_7seg)
+
+        else:
+            thousandsConverter = BcdTo7Segment()
+            hundredesConverter = BcdTo7Segment()
+            tensConverter = BcdTo7Segment()
+            onesConverter = BcdTo7Segment()
+
+            m.submodules += thousandsConverter, hundredesConverter, tensConverter, onesConverter
+
+            m.d.comb += [
+                thousandsConverter.i_bcd.eq(bcdConverter.o_thousands),
+                hundredesConverter.i_bcd.eq(bcdConverter.o_hundreds),
+                tensConverter.i_bcd.eq(bcdConverter.o_tens),
+                onesConverter.i_bcd.eq(bcdConverter.o_ones)
+            ]
+
+            with m.Switch(digitCounter):
+                with m.Case(0b1000):
+                    m.d.sync += self.o_segments.eq(thousandsConverter.o_7seg)
+                with m.Case(0b0100):
+                    m.d.sync += self.o_segments.eq(hundredesConverter.o_7seg)
+                with m.Case(0b0010):
+                    m.d.sync += self.o_segments.eq(tensConverter.o_7seg)
+                with m.Default():
+                    m.d.sync += self.o_segments.eq(onesConverter.o_7seg)
+
+        return m
+
+
+class DisplayEngine(Elaboratable):
+    # varredura de N digitos com modo hexadecimal, apagamento dos zeros a
+    # esquerda e brilho por digito em PWM. i_value entra como stream (um
+    # valor por ciclo se quiser); os digitos na tela so trocam no fim de
+    # uma varredura completa, entao nunca aparecem dois valores misturados
+    def __init__(self, digits=4, hexMode=False, refreshRate=200, brightnessBits=4,
+                 blankZeros=True, timebase=None):
+        self.digits = digits
+        self.hexMode = hexMode
+        self.refreshRate = refreshRate
+        self.brightnessBits = brightnessBits
+        self.blankZeros = blankZeros
+
+        self.tick = None
+        if (timebase != None):
+            self.tick = timebase.tick(refreshRate * digits * (1 << brightnessBits))
+
+        if (hexMode):
+            self.i_value = Signal(4 * digits)
+        else:
+            self.i_value = Signal(max=10 ** digits)
+        self.i_valid = Signal()
+        self.o_ready = Signal()
+        # brilho do digito n em i_brightness[n * brightnessBits:], maximo = aceso direto
+        self.i_brightness = Signal(brightnessBits * digits,
+                                   reset=(1 << (brightnessBits * digits)) - 1)
+        self.o_digits = Signal(digits)
+        self.o_segments = Signal(8)
+        # no modo decimal i_value vai ate 2**len - 1: acima de 10**digits - 1
+        # a tela satura em 9s e o_overflow fica em 1
+        self.o_overflow = Signal()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # um tick por passo de PWM: digits * 2^brightnessBits passos por varredura
+        levels = 1 << self.brightnessBits
+        tick = Signal()
+        if (self.tick is not None):
+            m.d.comb += tick.eq(self.tick)
+        else:
+            if (platform):
+                ticks = self.refreshRate * self.digits * levels
+                divideBy = max(0, int(round(platform.default_clk_frequency / ticks)) - 1)
+            else:
+                divideBy = 3
+            m.submodules.clkDiv = clkDiv = ClockDiv(divideBy)
+            m.d.comb += tick.eq(clkDiv.o_clk)
+
+        pending = Signal(4 * self.digits)
+        shown = Signal(4 * self.digits)
+
+        m.d.comb += self.o_ready.eq(1)
+
+        if (self.hexMode):
+            with m.If(self.i_valid):
+                m.d.sync += pending.eq(self.i_value)
+        else:
+            m.submodules.converter = converter = PipelinedBinaryToDecimal(
+                width=len(self.i_value))
+            m.d.comb += [
+                converter.i_value.eq(self.i_value),
+                converter.i_valid.eq(self.i_valid)
+            ]
+            overflow = Signal()
+            if (converter.digits > self.digits):
+                m.d.comb += overflow.eq(converter.o_bcd[4 * self.digits:] != 0)
+            nines = Cat(*[Const(9, 4)] * self.digits)
+            with m.If(converter.o_valid):
+                m.d.sync += [
+                    pending.eq(Mux(overflow, nines, converter.o_bcd[:4 * self.digits])),
+                    self.o_overflow.eq(overflow)
+                ]
+
+        # zeros a esquerda; o digito das unidades sempre aparece
+        leadingZeros = Signal(self.digits)
+        if (self.blankZeros):
+            zero = Const(1)
+            for i in reversed(range(1, self.digits)):
+                zero = zero & (pending[4 * i:4 * i + 4] == 0)
+                m.d.comb += leadingZeros[i].eq(zero)
+
+        blank = Signal(self.digits, reset=((1 << self.digits) - 2) if self.blankZeros else 0)
+
+        digit = Signal(max=self.digits, reset=self.digits - 1)
+        pwm = Signal(self.brightnessBits)
+
+        with m.If(tick):
+            m.d.sync += pwm.eq(pwm + 1)
+            with m.If(pwm == levels - 1):
+                with m.If(digit == 0):
+                    m.d.sync += [
+                        digit.eq(self.digits - 1),
+                        shown.eq(pending),
+                        blank.eq(leadingZeros)
+                    ]
+                with m.Else():
+                    m.d.sync += digit.eq(digit - 1)
+
+        m.submodules.decoder = decoder = BcdTo7Segment(hexDigits=self.hexMode)
+
+        nibbles = Array(shown[4 * i:4 * i + 4] for i in range(self.digits))
+        brightness = Array(self.i_brightness[self.brightnessBits * i:
+                                             self.brightnessBits * (i + 1)]
+                           for i in range(self.digits))
+        level = Signal(self.brightnessBits)
+        on = Signal()
+
+        m.d.comb += [
+            decoder.i_bcd.eq(nibbles[digit]),
+            level.eq(brightness[digit]),
+            on.eq(((pwm < level) | (level == levels - 1)) & ~blank.bit_select(digit, 1))
+        ]
+
+        # digito e segmentos registrados juntos: sem rastro do digito anterior
+        m.d.sync += [
+            self.o_digits.eq(Mux(on, Const(1, self.digits) << digit, 0)),
+            self.o_segments.eq(decoder.o_7seg)
+        ]
 
         return m
 
@@ -167,11 +465,17 @@ class Main(Elaboratable):
         digits = platform.request('display_7seg_ctrl')
         segments = platform.request('display_7seg')
 
-        display = SevenSegmentsDisplay()
-        m.submodules += display
+        m.submodules.timebase = timebase = Timebase()
+        m.submodules.display = display = DisplayEngine(digits=4, timebase=timebase)
+
+        # contador de decimos de segundo entrando como stream no display
+        counter = Signal(max=10000)
+        with m.If(timebase.tick(10)):
+            m.d.sync += counter.eq(Mux(counter == 9999, 0, counter + 1))
 
         m.d.comb += [
-            display.i_value.eq(1234),
+            display.i_value.eq(counter),
+            display.i_valid.eq(1),
             digits.eq(display.o_digits),
             segments.eq(display.o_segments)
         ]
@@ -179,34 +483,115 @@ class Main(Elaboratable):
         return m
 
 
+# o BinaryToDecimalConverter tem 4 digitos: acima disso o resultado nao
+# tem significado (o nibble dos milhares nunca recebe o +3)
+MAX_DECIMAL = 9999
+
+
+def referenceBcd(values):
+    # os 4 digitos decimais de cada valor em BCD, vetorizado
+    import numpy as np
+    values = np.asarray(values, dtype=np.uint32)
+    return ((values % 10)
+            | (values // 10 % 10) << 4
+            | (values // 100 % 10) << 8
+            | (values // 1000 % 10) << 12)
+
+
+def convertRange(start, stop):
+    # um simulador por processo do pool, convertendo [start, stop)
+    m = Module()
+    m.submodules.main = main = BinaryToDecimalConverter(onChange=False)
+    sim = Simulator(m)
+    sim.add_clock(1e-6)
+
+    results = []
+
+    def process():
+        for value in range(start, stop):
+            yield main.i_value.eq(value)
+            yield main.i_valid.eq(1)
+            yield
+            yield main.i_valid.eq(0)
+            # o_valid lido um ciclo atrasado: os digitos continuam estaveis
+            while not (yield main.o_valid):
+                yield
+            results.append(((yield main.o_thousands) << 12) | ((yield main.o_hundreds) << 8)
+                           | ((yield main.o_tens) << 4) | (yield main.o_ones))
+
+    sim.add_sync_process(process)
+    sim.run()
+    return start, results
+
+
 def parse_args():
-    parser = ArgumentParser()
-    p_action = parser.add_subparsers(dest='action')
+    parser, p_action = designParser()
     p_action.add_parser('simulate')
-    p_action.add_parser('build')
-    p_program = p_action.add_parser('program')
-
-    p_program.add_argument('-f', '--flash',
-                           help='save the bitstream in flash',
-                           action='store_true')
+    p_action.add_parser('simulatearbiter')
+    p_action.add_parser('simulatedisplay')
+    p_engine = p_action.add_parser('simulateengine')
+    p_engine.add_argument('-x', '--hex', help='hexadecimal digits',
+                          action='store_true')
+    p_action.add_parser('report')
+    p_verify = p_action.add_parser('verify')
+    p_verify.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                          help='simulator processes')
+    p_verify.add_argument('-n', '--count', type=int, default=MAX_DECIMAL + 1,
+                          help='check the inputs 0 to count - 1 (at most 9999)')
+    p_pipeline = p_action.add_parser('simulatepipeline')
+    p_pipeline.add_argument('-w', '--width', type=int, default=16)
+    p_pipeline.add_argument('-s', '--stage', type=int, default=1,
+                            help='bits converted per pipeline stage')
+
+    addTraceArgs(p_action)
 
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
-    platform = FpgaDevBoard()
-
-    if args.action == 'build':
-        platform.build(Main(platform=platform))
 
-    elif args.action == 'program':
-        if args.flash:
-            platform.build(Main(platform=platform), do_program=True,
-                           program_opts={"flash": True})
-        else:
-            platform.build(Main(platform=platform), do_program=True,
-                           program_opts={"flash": False})
+    boardAction(args, lambda platform: Main())
+
+    if args.action == 'report':
+        from shared.board.fpga_dev_board import FpgaDevBoard
+        printUsage([
+            ('BcdTo7Segment', BcdTo7Segment()),
+            ('BinaryToDecimalConverter', BinaryToDecimalConverter()),
+            ('SevenSegmentsDisplay (4 decoders)', SevenSegmentsDisplay(sharedDecoder=False)),
+            ('SevenSegmentsDisplay', SevenSegmentsDisplay()),
+            ('DisplayEngine', DisplayEngine()),
+            ('DisplayEngine (hex)', DisplayEngine(hexMode=True))
+        ], FpgaDevBoard())
+
+    elif args.action == 'verify':
+        import numpy as np
+
+        count = min(args.count, MAX_DECIMAL + 1)
+        if (args.count > count):
+            print("inputs {} to {} out of range of 4 digits, not checked".format(
+                count, args.count - 1))
+
+        start = time.time()
+        chunk = max(1, -(-count // (4 * args.jobs)))
+        ranges = [(n, min(n + chunk, count)) for n in range(0, count, chunk)]
+
+        received = np.zeros(count, dtype=np.uint32)
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            for first, results in pool.map(convertRange, *zip(*ranges)):
+                received[first:first + len(results)] = results
+
+        values = np.arange(count)
+        failures = np.flatnonzero(received != referenceBcd(values))
+        elapsed = time.time() - start
+
+        for value in failures[:10]:
+            print("{}: got {:04x}, expected {:04x}".format(
+                value, received[value], referenceBcd(value)))
+        print("{} inputs, {} failures, {} jobs, {:.1f} s".format(
+            count, len(failures), args.jobs, elapsed))
+        if (len(failures)):
+            sys.exit(1)
 
     elif args.action == 'simulate':
         main = BinaryToDecimalConverter()
@@ -220,5 +605,198 @@ if __name__ == "__main__":
             yield Delay(6e-3)
 
         sim.add_sync_process(process)
-        with sim.write_vcd("test.vcd", "test.gtkw"):
+        with traceVcd(sim, args):
+            sim.run()
+
+    elif args.action == 'simulatepipeline':
+        m = Module()
+        m.submodules.main = main = PipelinedBinaryToDecimal(width=args.width,
+                                                            bitsPerStage=args.stage)
+        sim = Simulator(m)
+        sim.add_clock(1e-6)
+
+        # extremos, uma contagem e valores aleatorios, um por ciclo
+        maxValue = 2 ** args.width - 1
+        values = [0, maxValue, 1, maxValue - 1]
+        values += [n & maxValue for n in range(500)]
+        values += [random.getrandbits(args.width) for n in range(500)]
+
+        def process():
+            for value in values:
+                yield main.i_value.eq(value)
+                yield main.i_valid.eq(1)
+                yield
+            yield main.i_valid.eq(0)
+
+        def check():
+            received = []
+            cycles = 0
+            while len(received) < len(values):
+                yield
+                yield Settle()
+                cycles += 1
+                if (yield main.o_valid):
+                    if (not received):
+                        latency = cycles
+                    bcd = yield main.o_bcd
+                    received.append(int("".join("{:x}".format((bcd >> (4 * i)) & 0xF)
+                                                for i in reversed(range(main.digits)))))
+                else:
+                    assert not received, "bubble in the pipeline"
+
+            assert received == values, [(a, b) for a, b in zip(values, received) if a != b][:5]
+            assert latency == main.latency, latency
+            print(len(received), "values converted, latency", main.latency, "cycles")
+
+        sim.add_sync_process(process)
+        sim.add_sync_process(check)
+        with traceVcd(sim, args):
+            sim.run()
+
+    elif args.action == 'simulatearbiter':
+        m = Module()
+        m.submodules.main = main = BinaryToDecimalArbiter(clients=3)
+        sim = Simulator(m)
+        sim.add_clock(1e-6)
+
+        requests = 10
+        served = []
+
+        def client(n):
+            def process():
+                # cada cliente pede uma conversao atras da outra
+                for r in range(requests):
+                    value = random.randrange(10000)
+                    yield main.i_value[n].eq(value)
+                    yield main.i_valid[n].eq(1)
+                    yield
+                    yield Settle()
+                    while not (yield main.o_ready[n]):
+                        yield
+                        yield Settle()
+                    yield
+                    yield main.i_valid[n].eq(0)
+
+                    yield Settle()
+                    while not (yield main.o_valid[n]):
+                        yield
+                        yield Settle()
+                    bcd = yield main.o_bcd[n]
+                    assert bcd == int(str(value), 16), (n, value, hex(bcd))
+                    served.append(n)
+            return process
+
+        def check():
+            while len(served) < 3 * requests:
+                yield
+            # round robin: com os tres sempre pedindo, ninguem espera duas vezes
+            for i in range(0, len(served), 3):
+                assert sorted(served[i:i + 3]) == [0, 1, 2], served
+            print(len(served), "conversions, order", served[:9])
+
+        for n in range(3):
+            sim.add_sync_process(client(n))
+        sim.add_sync_process(check)
+        with traceVcd(sim, args):
+            sim.run()
+
+    elif args.action == 'simulatedisplay':
+        m = Module()
+        m.submodules.shared = shared = SevenSegmentsDisplay()
+        m.submodules.original = original = SevenSegmentsDisplay(sharedDecoder=False)
+        m.d.comb += [
+            shared.i_value.eq(1234),
+            original.i_value.eq(1234)
+        ]
+        # ClockDiv 1000x mais rapido: cada digito fica 150 ciclos aceso
+        sim = SimPlatform(timeScale=1000).simulator(m)
+
+        patterns = {0b1000: 0b10000110, 0b0100: 0b11011011,
+                    0b0010: 0b11001111, 0b0001: 0b11100110}
+
+        def process():
+            seen = set()
+            for c in range(2000):
+                yield
+                digits = yield shared.o_digits
+                segments = yield shared.o_segments
+                assert digits == (yield original.o_digits)
+                assert segments == (yield original.o_segments), (bin(digits), bin(segments))
+                # espera o conversor terminar antes de olhar os segmentos
+                if (c > 100):
+                    seen.add((digits, segments))
+            for digits, segments in patterns.items():
+                assert (digits, segments) in seen, (bin(digits), seen)
+            print("display shows 1234 on", len(patterns), "digits")
+
+        sim.add_sync_process(process)
+        with traceVcd(sim, args):
+            sim.run()
+
+    elif args.action == 'simulateengine':
+        m = Module()
+        m.submodules.main = main = DisplayEngine(digits=4, hexMode=args.hex)
+        sim = Simulator(m)
+        sim.add_clock(1e-6)
+
+        glyphs = {0b10111111: '0', 0b10000110: '1', 0b11011011: '2', 0b11001111: '3',
+                  0b11100110: '4', 0b11101101: '5', 0b11111101: '6', 0b10000111: '7',
+                  0b11111111: '8', 0b11101111: '9', 0b11110111: 'A', 0b11111100: 'b',
+                  0b10111001: 'C', 0b11011110: 'd', 0b11111001: 'E', 0b11110001: 'F'}
+        # sem platform: tick a cada 4 ciclos, 16 niveis de PWM por digito
+        digitCycles = 4 * 16
+        frameCycles = 4 * digitCycles
+
+        if (args.hex):
+            final, expected = 0x0BEF, ' bEF'
+        else:
+            final, expected = 42, '  42'
+
+        def frame():
+            # uma varredura: texto mostrado e ciclos aceso de cada digito
+            text = [' '] * 4
+            onCycles = [0] * 4
+            for c in range(frameCycles):
+                yield
+                digits = yield main.o_digits
+                if (digits):
+                    n = digits.bit_length() - 1
+                    text[3 - n] = glyphs[(yield main.o_segments)]
+                    onCycles[n] += 1
+            return ''.join(text), onCycles
+
+        def process():
+            # stream: um valor novo por ciclo durante duas varreduras
+            yield main.i_valid.eq(1)
+            for c in range(2 * frameCycles):
+                yield main.i_value.eq(c)
+                yield
+            yield main.i_value.eq(final)
+            yield
+            yield main.i_valid.eq(0)
+            # digito das unidades com 4/16 de brilho
+            yield main.i_brightness.eq(0xFFF4)
+
+            for c in range(2 * frameCycles):
+                yield
+            text, onCycles = yield from frame()
+            assert text == expected, (text, expected)
+            assert onCycles[0] == 4 * digitCycles // 16, onCycles
+            assert onCycles[1] == digitCycles, onCycles
+            print("display shows '{}', digit on cycles {}".format(text, onCycles))
+
+            if (not args.hex):
+                # 12345 nao cabe em 4 digitos
+                yield main.i_value.eq(12345)
+                yield main.i_valid.eq(1)
+                yield
+                yield main.i_valid.eq(0)
+                for c in range(2 * frameCycles):
+                    yield
+                text, onCycles = yield from frame()
+                assert text == '9999' and (yield main.o_overflow), text
+                print("12345 overflows, display shows '{}'".format(text))
+
+        sim.add_sync_process(process)
+        with traceVcd(sim, args):
             sim.run()
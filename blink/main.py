@@ -1,7 +1,6 @@
-from argparse import ArgumentParser
-
 from nmigen import *
-from shared.board.fpga_dev_board import FpgaDevBoard
+from shared.cli import designParser, boardAction
+from shared.waveform import traceVcd, addTraceArgs
 from nmigen.back.pysim import Simulator, Delay
 
 
@@ -35,35 +34,20 @@ class Main(Elaboratable):
 
 
 def parse_args():
-    parser = ArgumentParser()
-    p_action = parser.add_subparsers(dest='action')
+    parser, p_action = designParser()
     p_action.add_parser('simulate')
-    p_action.add_parser('build')
-    p_program = p_action.add_parser('program')
 
-    p_program.add_argument('-f', '--flash',
-                           help='save the bitstream in flash',
-                           action='store_true')
+    addTraceArgs(p_action)
 
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
-    platform = FpgaDevBoard()
-
-    if args.action == 'build':
-        platform.build(Main(platform=platform))
 
-    elif args.action == 'program':
-        if args.flash:
-            platform.build(Main(platform=platform), do_program=True,
-                           program_opts={"flash": True})
-        else:
-            platform.build(Main(platform=platform), do_program=True,
-                           program_opts={"flash": False})
+    boardAction(args, lambda platform: Main(platform=platform))
 
-    elif args.action == 'simulate':
+    if args.action == 'simulate':
         main = Main()
         m = Module()
         m.submodules.main = main
@@ -76,5 +60,5 @@ if __name__ == "__main__":
                 yield
 
         sim.add_sync_process(process)
-        with sim.write_vcd("test.vcd", "test.gtkw", traces=platform._ports):
+        with traceVcd(sim, args):
             sim.run()
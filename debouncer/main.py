@@ -1,52 +1,126 @@
-from argparse import ArgumentParser
-
 from nmigen import *
-from shared.board.fpga_dev_board import FpgaDevBoard
-from nmigen.back.pysim import Simulator, Delay, Settle
-
-class ClockDiv(Elaboratable):
-    def __init__(self, platform=None):
-        self.o_clk = Signal()
+from nmigen.lib.cdc import FFSynchronizer
+from shared.cli import designParser, boardAction
+from shared.clockDiv import ClockDiv
+from shared.simPlatform import SimPlatform
+from shared.timebase import Timebase
+from shared.waveform import traceVcd, addTraceArgs
+from nmigen.back.pysim import Simulator, Delay, Settle, Passive
+
+
+class MultiDebouncer(Elaboratable):
+    # um tick de amostragem para todos os canais; cada canal so tem seu
+    # estado e o bit de saida. debounceMs e o tempo que a entrada precisa
+    # ficar estavel (ou, no modo eager, o tempo em que bounces sao ignorados):
+    #   shift:      `samples` amostras iguais seguidas
+    #   integrator: contador saturado em 0 e `samples`, aguenta ruido
+    #   eager:      a primeira borda sai na hora e trava o canal por debounceMs
+    def __init__(self, channels=4, debounceMs=10, mode='shift', samples=8, timebase=None):
+        assert mode in ('shift', 'integrator', 'eager'), mode
+
+        self.channels = channels
+        self.debounceMs = debounceMs
+        self.mode = mode
+        self.samples = samples
+
+        self.tick = None
+        if (timebase != None):
+            self.tick = timebase.tick(samples * 1000 / debounceMs)
+
+        self.i_raw = Signal(channels)
+        self.o_clean = Signal(channels)
+        self.o_rise = Signal(channels)
+        self.o_fall = Signal(channels)
 
     def elaborate(self, platform):
         m = Module()
-        counter = Signal(max=294980)
 
-        with m.If(counter == 294980):
-            m.d.sync += counter.eq(0)
-            m.d.sync += self.o_clk.eq(1)
-        with m.Else():
-            m.d.sync += counter.eq(counter + 1)
-            m.d.sync += self.o_clk.eq(0)
+        tick = Signal()
+        if (self.tick is not None):
+            m.d.comb += tick.eq(self.tick)
+        else:
+            if (platform):
+                tickCycles = platform.default_clk_frequency * self.debounceMs / 1000 / self.samples
+                divideBy = max(0, int(round(tickCycles)) - 1)
+            else:
+                divideBy = 3
+            m.submodules.clkDiv = clkDiv = ClockDiv(divideBy)
+            m.d.comb += tick.eq(clkDiv.o_clk)
+
+        # botoes soltos (1) ate o sincronizador encher
+        raw = Signal(self.channels, reset=(1 << self.channels) - 1)
+        m.submodules.sync = FFSynchronizer(self.i_raw, raw, reset=(1 << self.channels) - 1)
+
+        clean = Signal(self.channels)
+        m.d.comb += self.o_clean.eq(clean)
+        m.d.sync += [
+            self.o_rise.eq(0),
+            self.o_fall.eq(0)
+        ]
+
+        for n in range(self.channels):
+            # botoes ativos em 0
+            pressed = ~raw[n]
+
+            if (self.mode == 'shift'):
+                history = Signal(self.samples, name="history{}".format(n))
+                with m.If(tick):
+                    m.d.sync += history.eq(Cat(history[1:], pressed))
+
+                rise = (history == (1 << self.samples) - 1) & ~clean[n]
+                fall = (history == 0) & clean[n]
+
+            elif (self.mode == 'integrator'):
+                level = Signal(max=self.samples + 1, name="level{}".format(n))
+                with m.If(tick):
+                    with m.If(pressed & (level != self.samples)):
+                        m.d.sync += level.eq(level + 1)
+                    with m.Elif(~pressed & (level != 0)):
+                        m.d.sync += level.eq(level - 1)
+
+                rise = (level == self.samples) & ~clean[n]
+                fall = (level == 0) & clean[n]
+
+            else:
+                lockout = Signal(max=self.samples + 1, name="lockout{}".format(n))
+                with m.If(tick & (lockout != 0)):
+                    m.d.sync += lockout.eq(lockout - 1)
+
+                rise = (lockout == 0) & pressed & ~clean[n]
+                fall = (lockout == 0) & ~pressed & clean[n]
+                with m.If(rise | fall):
+                    m.d.sync += lockout.eq(self.samples)
+
+            with m.If(rise):
+                m.d.sync += [
+                    clean[n].eq(1),
+                    self.o_rise[n].eq(1)
+                ]
+            with m.Elif(fall):
+                m.d.sync += [
+                    clean[n].eq(0),
+                    self.o_fall[n].eq(1)
+                ]
 
         return m
 
 
 class Debouncer(Elaboratable):
-    def __init__(self):
+    def __init__(self, debounceMs=10, mode='shift'):
         self.i_raw = Signal()
         self.o_clean = Signal()
+        self.debounceMs = debounceMs
+        self.mode = mode
 
-    def elaborate(self, patform):
+    def elaborate(self, platform):
         m = Module()
-        debouncedOutput = Signal()
-        counter = Signal(8)
-
-        clkDivider = ClockDiv()
-        m.submodules += clkDivider
-
-        m.d.comb += self.o_clean.eq(debouncedOutput)
-
-        with m.If(clkDivider.o_clk):
-            m.d.sync += counter.eq(
-                Cat(counter[1:], ~self.i_raw))
 
-        with m.If(counter == 0xFF):
-            m.d.sync += debouncedOutput.eq(1)
-        with m.Elif(counter == 0x00):
-            m.d.sync += debouncedOutput.eq(0)
-        with m.Else():
-            m.d.sync += debouncedOutput.eq(debouncedOutput)
+        m.submodules.debouncer = debouncer = MultiDebouncer(
+            channels=1, debounceMs=self.debounceMs, mode=self.mode)
+        m.d.comb += [
+            debouncer.i_raw.eq(self.i_raw),
+            self.o_clean.eq(debouncer.o_clean)
+        ]
 
         return m
 
@@ -60,21 +134,12 @@ class LedToggler(Elaboratable):
         m = Module()
 
         ledState = Signal()
-        prevDebouncedOutput = Signal()
-        debouncedOutput = Signal()
-
-        debouncer = Debouncer()
-        m.submodules += debouncer
 
         m.d.comb += self.o_led.eq(ledState)
 
-        m.d.comb += debouncer.i_raw.eq(self.i_toggle)
-        m.d.comb += debouncedOutput.eq(debouncer.o_clean)
-
-        with m.If(prevDebouncedOutput != debouncedOutput):
-            m.d.sync += prevDebouncedOutput.eq(debouncedOutput)
-            with m.If(debouncedOutput == 1):
-                m.d.sync += ledState.eq(~ledState)
+        # i_toggle e o pulso de borda de subida do botao ja sem bounce
+        with m.If(self.i_toggle):
+            m.d.sync += ledState.eq(~ledState)
 
         return m
 
@@ -82,76 +147,117 @@ class LedToggler(Elaboratable):
 class Main(Elaboratable):
     def __init__(self, platform=None):
         self.clk_freq = platform.default_clk_frequency
-        self.i_button_1_raw = platform.request("button", 0)
-        self.i_button_2_raw = platform.request("button", 1)
+        self.i_buttons = [platform.request("button", n) for n in range(4)]
         self.o_green_led = platform.request("led", 0)
         self.o_orange_led = platform.request("led", 1)
 
     def elaborate(self, platform):
         m = Module()
 
+        timebase = Timebase()
+        debouncer = MultiDebouncer(channels=len(self.i_buttons), mode='eager',
+                                   timebase=timebase)
         greenLedToggler = LedToggler()
         orangeLedToggler = LedToggler()
 
+        m.submodules += timebase
+        m.submodules += debouncer
         m.submodules += greenLedToggler
         m.submodules += orangeLedToggler
 
-        m.d.comb += greenLedToggler.i_toggle.eq(self.i_button_1_raw)
-        m.d.comb += orangeLedToggler.i_toggle.eq(self.i_button_2_raw)
-        m.d.comb += self.o_green_led.eq(greenLedToggler.o_led)
-        m.d.comb += self.o_orange_led.eq(orangeLedToggler.o_led)
+        m.d.comb += debouncer.i_raw.eq(Cat(*self.i_buttons))
+        # botoes 1 e 2 trocam um led cada, o 3 troca os dois e o 4 acende
+        # os dois enquanto estiver pressionado
+        m.d.comb += greenLedToggler.i_toggle.eq(debouncer.o_rise[0] | debouncer.o_rise[2])
+        m.d.comb += orangeLedToggler.i_toggle.eq(debouncer.o_rise[1] | debouncer.o_rise[2])
+        m.d.comb += self.o_green_led.eq(greenLedToggler.o_led | debouncer.o_clean[3])
+        m.d.comb += self.o_orange_led.eq(orangeLedToggler.o_led | debouncer.o_clean[3])
 
         return m
 
 
 def parse_args():
-    parser = ArgumentParser()
-    p_action = parser.add_subparsers(dest='action')
-    p_action.add_parser('simulate')
-    p_action.add_parser('build')
-    p_program = p_action.add_parser('program')
+    parser, p_action = designParser()
+    p_simulate = p_action.add_parser('simulate')
+    p_simulate.add_argument('-m', '--mode', default='shift',
+                            choices=['shift', 'integrator', 'eager'])
+    p_simulate.add_argument('-t', '--time', type=float, default=10,
+                            help='debounce time in ms')
 
-    p_program.add_argument('-f', '--flash',
-                           help='save the bitstream in flash',
-                           action='store_true')
+    addTraceArgs(p_action)
 
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
-    platform = FpgaDevBoard()
 
-    print(platform._ports)
+    boardAction(args, lambda platform: Main(platform=platform))
 
-    if args.action == 'build':
-        platform.build(Main(platform=platform))
-
-    elif args.action == 'program':
-        if args.flash:
-            platform.build(Main(platform=platform), do_program=True,
-                           program_opts={"flash": True})
-        else:
-            platform.build(Main(platform=platform), do_program=True,
-                           program_opts={"flash": False})
-
-    elif args.action == 'simulate':
-        main = Debouncer()
+    if args.action == 'simulate':
         m = Module()
-        btn = Signal()
-        m.d.comb += main.i_raw.eq(btn)
-        m.submodules.main = main
-
-        sim = Simulator(m)
-        sim.add_clock(1e-6)
-
-        def process():
-            yield Delay(6e-3)
-            yield btn.eq(1)
-            yield Delay(1e-3)
-            yield btn.eq(0)
-            yield Delay(1e-3)
-
-        sim.add_sync_process(process)
-        with sim.write_vcd("test.vcd", "test.gtkw", traces=[btn, main.o_clean]):
+        buttons = Signal(4, reset=0b1111)
+        m.submodules.main = main = MultiDebouncer(channels=4, debounceMs=args.time,
+                                                  mode=args.mode)
+        m.d.comb += main.i_raw.eq(buttons)
+
+        # timers 100x mais rapidos: o tempo de debounce vira alguns milhares de ciclos
+        simPlatform = SimPlatform(timeScale=100)
+        sim = simPlatform.simulator(m)
+        msCycles = simPlatform.default_clk_frequency / 1000 / simPlatform.timeScale
+        debounceCycles = int(args.time * msCycles)
+
+        rises = [[] for n in range(4)]
+        falls = [[] for n in range(4)]
+        cycle = [0]
+
+        def bounce(n, levels):
+            # o canal n troca de nivel a cada (n + 1) / 32 do tempo de debounce;
+            # o bounce todo dura menos que debounceMs, como o modo eager exige
+            for level in levels:
+                yield buttons[n].eq(level)
+                for c in range((n + 1) * debounceCycles // 32):
+                    yield
+
+        def channel(n):
+            def process():
+                for c in range(2 * debounceCycles):
+                    yield
+                pressedAt = cycle[0]
+                yield from bounce(n, [0, 1, 0, 1, 0])
+                for c in range(3 * debounceCycles):
+                    yield
+                releasedAt = cycle[0]
+                yield from bounce(n, [1, 0, 1, 0, 1])
+                for c in range(3 * debounceCycles):
+                    yield
+
+                assert len(rises[n]) == 1 and len(falls[n]) == 1, (n, rises[n], falls[n])
+                rises[n][0] -= pressedAt
+                falls[n][0] -= releasedAt
+            return process
+
+        def count():
+            yield Passive()
+            while True:
+                yield
+                cycle[0] += 1
+                rise = yield main.o_rise
+                fall = yield main.o_fall
+                for n in range(4):
+                    if ((rise >> n) & 1):
+                        rises[n].append(cycle[0])
+                    if ((fall >> n) & 1):
+                        falls[n].append(cycle[0])
+
+        for n in range(4):
+            sim.add_sync_process(channel(n))
+        sim.add_sync_process(count)
+        with traceVcd(sim, args):
             sim.run()
+
+        # ciclos da simulacao convertidos para ms do hardware (timers 100x mais rapidos)
+        press = max(r[0] for r in rises) / msCycles
+        release = max(f[0] for f in falls) / msCycles
+        print("{}: one event per press and release, worst press to event {:.2f} ms, "
+              "release to event {:.2f} ms".format(args.mode, press, release))
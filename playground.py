@@ -0,0 +1,98 @@
+import os
+import re
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fnmatch import fnmatch
+
+# roda as acoes dos main.py de todos os designs em paralelo, cada uma no
+# seu processo. nao importa o nmigen: as acoes de cada design sao lidas do
+# proprio main.py, entao --help e list respondem na hora
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def findDesigns():
+    designs = {}
+    for name in sorted(os.listdir(ROOT)):
+        path = os.path.join(ROOT, name, 'main.py')
+        if (not os.path.isfile(path)):
+            continue
+
+        with open(path) as f:
+            source = f.read()
+        actions = re.findall(r"add_parser\('(\w+)'", source)
+        if ('designParser()' in source):
+            actions = ['build', 'program'] + actions
+        designs[name] = actions
+    return designs
+
+
+def runJob(design, action, logDir):
+    # simulacoes rodam num diretorio proprio (o test.vcd de uma nao
+    # sobrescreve o de outra); o build roda no design, onde fica o build/
+    jobDir = os.path.join(logDir, '{}-{}'.format(design, action))
+    os.makedirs(jobDir, exist_ok=True)
+    cwd = os.path.join(ROOT, design) if action == 'build' else jobDir
+
+    logPath = os.path.join(jobDir, 'log.txt')
+    start = time.time()
+    with open(logPath, 'w') as log:
+        result = subprocess.run(
+            [sys.executable, os.path.join(ROOT, design, 'main.py'), action],
+            cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+
+    return design, action, result.returncode, time.time() - start, logPath
+
+
+def parse_args():
+    parser = ArgumentParser(description='build and simulate every design')
+    parser.add_argument('actions', nargs='*', default=['simulate*'],
+                        help='actions to run, glob patterns like simulate* are accepted; '
+                             '"list" shows the actions of each design')
+    parser.add_argument('-d', '--design', action='append',
+                        help='only run this design (repeatable)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='parallel jobs')
+    parser.add_argument('-l', '--logs', default=os.path.join(ROOT, 'runs'),
+                        help='directory of the per job logs')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    designs = findDesigns()
+
+    if (args.design):
+        designs = {d: a for d, a in designs.items() if d in args.design}
+
+    if (args.actions == ['list']):
+        for design, actions in designs.items():
+            print('{:<12}{}'.format(design, ' '.join(actions)))
+        sys.exit(0)
+
+    # program usa a placa, um design por vez; fica fora do paralelo
+    jobs = []
+    for design, actions in designs.items():
+        for action in actions:
+            if (action != 'program' and any(fnmatch(action, p) for p in args.actions)):
+                jobs.append((design, action))
+
+    if (not jobs):
+        sys.exit("no action matches {}".format(' '.join(args.actions)))
+
+    start = time.time()
+    failed = 0
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(runJob, design, action, args.logs) for design, action in jobs]
+        for future in as_completed(futures):
+            design, action, code, seconds, logPath = future.result()
+            status = 'ok' if code == 0 else 'FAILED'
+            failed += code != 0
+            print('{:<12}{:<20}{:<8}{:>9.1f}s  {}'.format(
+                design, action, status, seconds, os.path.relpath(logPath)))
+
+    print('{} jobs, {} failed, {:.1f}s'.format(len(jobs), failed, time.time() - start))
+    sys.exit(1 if failed else 0)
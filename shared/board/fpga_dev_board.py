@@ -1,12 +1,47 @@
+import hashlib
 import os
 import subprocess
 
+from nmigen import *
+from nmigen._toolchain import require_tool
 from nmigen.build import *
+from nmigen.lib.cdc import ResetSynchronizer
 from nmigen.vendor.xilinx_spartan_3_6 import *
 from nmigen_boards.resources import *
 
+from shared.buildCache import cachedBuild, programmedHash, recordProgrammed
+from shared.buildReport import recordBuild
 
-__all__ = ["FpgaDevBoard"]
+
+__all__ = ["FpgaDevBoard", "pllParameters"]
+
+
+def pllParameters(inputFrequency, targetFrequency):
+    # PLL_BASE do Spartan-6 (-2): PFD entre 19 e 500MHz, VCO entre 400 e
+    # 1000MHz. procura o DIVCLK/CLKFBOUT_MULT/CLKOUT0_DIVIDE mais proximo
+    best = None
+    for divide in range(1, 53):
+        pfd = inputFrequency / divide
+        if (pfd < 19e6 or pfd > 500e6):
+            continue
+        for mult in range(1, 65):
+            vco = pfd * mult
+            if (vco < 400e6 or vco > 1000e6):
+                continue
+            for outDivide in range(1, 129):
+                frequency = vco / outDivide
+                error = abs(frequency - targetFrequency)
+                if (best == None or error < best['error']):
+                    best = {
+                        'divide': divide,
+                        'mult': mult,
+                        'outDivide': outDivide,
+                        'frequency': frequency,
+                        'error': error
+                    }
+
+    assert best != None, "no PLL setting for {} Hz".format(targetFrequency)
+    return best
 
 
 class FpgaDevBoard(XilinxSpartan6Platform):
@@ -43,12 +78,139 @@ class FpgaDevBoard(XilinxSpartan6Platform):
     ]
     connectors = []
 
+    # map com -detail (uso por submodulo no .mrp) e o trce no fim do fluxo
+    # gerando o .twr, lidos pelo shared/buildReport.py depois do build
+    required_tools = XilinxSpartan6Platform.required_tools + ["trce"]
+    command_templates = [
+        template.replace('{{verbose("-detail")}}', '-detail')
+        for template in XilinxSpartan6Platform.command_templates
+    ] + [
+        r"""
+        {{invoke_tool("trce")}}
+            {{get_override("trce_opts")|default(["-v 10"])|options}}
+            -o {{name}}.twr
+            {{name}}_par.ncd
+            {{name}}.pcf
+        """
+    ]
+
+    def __init__(self, sysClkFrequency=None, compress=None):
+        super().__init__()
+
+        # bitstream comprimido: menos dados pelo JTAG e na flash. ligado por
+        # padrao, compress=0 no ambiente desliga
+        if (compress == None):
+            compress = os.environ.get("compress", "1") != "0"
+        self.compress = compress
+
+        # dominio sync gerado por um PLL a partir do clk da placa; tambem
+        # pode vir da variavel de ambiente sys_clk (em MHz), assim qualquer
+        # main.py roda mais rapido sem mudar nada
+        if (sysClkFrequency == None and os.environ.get("sys_clk")):
+            sysClkFrequency = float(os.environ["sys_clk"]) * 1e6
+
+        self.pll = None
+        if (sysClkFrequency != None):
+            self.pll = pllParameters(super().default_clk_frequency, sysClkFrequency)
+            print("FpgaDevBoard: sync at {:.3f} MHz (PLL x{} /{} /{})".format(
+                self.pll['frequency'] / 1e6, self.pll['mult'],
+                self.pll['divide'], self.pll['outDivide']))
+
+    @property
+    def default_clk_frequency(self):
+        # os divisores derivados de default_clk_frequency acompanham o PLL
+        if (self.pll != None):
+            return self.pll['frequency']
+        return super().default_clk_frequency
+
+    def create_missing_domain(self, name):
+        if (name != "sync" or self.pll == None):
+            return super().create_missing_domain(name)
+
+        clk_i = self.request(self.default_clk).i
+        inputPeriod = round(1e9 / super().default_clk_frequency, 3)
+
+        m = Module()
+        feedback = Signal()
+        pllClk = Signal()
+        locked = Signal()
+        eos = Signal()
+
+        m.submodules.pll = Instance("PLL_BASE",
+                                    p_BANDWIDTH="OPTIMIZED",
+                                    p_CLK_FEEDBACK="CLKFBOUT",
+                                    p_COMPENSATION="INTERNAL",
+                                    p_CLKIN_PERIOD=inputPeriod,
+                                    p_DIVCLK_DIVIDE=self.pll['divide'],
+                                    p_CLKFBOUT_MULT=self.pll['mult'],
+                                    p_CLKOUT0_DIVIDE=self.pll['outDivide'],
+                                    p_CLKOUT0_DUTY_CYCLE=0.5,
+                                    p_CLKOUT0_PHASE=0.0,
+                                    i_CLKIN=clk_i,
+                                    i_CLKFBIN=feedback,
+                                    i_RST=Const(0),
+                                    o_CLKFBOUT=feedback,
+                                    o_CLKOUT0=pllClk,
+                                    o_LOCKED=locked)
+
+        # como na platform original: o clock so sai depois do fim da
+        # configuracao (EOS) e o reset fica ativo ate o PLL travar
+        m.submodules.startup = Instance("STARTUP_SPARTAN6", o_EOS=eos)
+        m.domains += ClockDomain("sync")
+        m.submodules.bufg = Instance("BUFGCE", i_CE=eos, i_I=pllClk,
+                                     o_O=ClockSignal("sync"))
+        m.submodules.reset_sync = ResetSynchronizer(~locked, domain="sync")
+        return m
+
+    def build(self, elaboratable, name="top", build_dir="build", do_build=True,
+              program_opts=None, do_program=False, **kwargs):
+        # o xst achata a hierarquia; com keep_hierarchy=1 o .mrp mostra o
+        # uso de cada submodulo, mas a otimizacao entre modulos fica limitada
+        if (os.environ.get("keep_hierarchy") and "script_after_run" not in kwargs):
+            kwargs["script_after_run"] = "-keep_hierarchy yes"
+        kwargs.setdefault("bitgen_opts", ["-g Compress"] if self.compress else [])
+
+        plan = self.prepare(elaboratable, name, **kwargs)
+        if (not do_build):
+            return plan
+
+        def execute():
+            if (self._toolchain_env_var not in os.environ):
+                for tool in self.required_tools:
+                    require_tool(tool)
+            return plan.execute_local(build_dir)
+
+        # se o plano ja foi construido antes, o bitstream vem do cache
+        outputs = [name + ext for ext in [".bit", ".bin", "_map.mrp", ".twr"]]
+        products, hit = cachedBuild(plan, self, build_dir, outputs, execute)
+        if (not hit):
+            recordBuild(products, name, build_dir, self)
+
+        if (do_program):
+            self.toolchain_program(products, name, **(program_opts or {}))
+        return products
+
     def toolchain_program(self, products, name, **options):
+        # o FPGA perde a configuracao ao desligar (e o registro nao ve isso),
+        # entao o JTAG sempre carrega. so a flash guarda o hash do ultimo
+        # bitstream gravado: se for o mesmo, so verifica e recarrega o FPGA;
+        # se a verificacao falhar, grava tudo. force=True grava sempre
         fpgaprog = os.environ.get("fpgaprog", "fpgaprog")
+        bitstream = products.get("{}.bit".format(name))
+        digest = hashlib.sha256(bitstream).hexdigest()
+
         with products.extract("{}.bit".format(name)) as bitstream_filename:
-            if options.get("flash"):
-                subprocess.run(
-                    [fpgaprog, "-v", "-f", bitstream_filename, "-b", "shared/board/bscan_spi_lx9.bit", "-sa", "-r"], check=True)
-            else:
+            if (not options.get("flash")):
                 subprocess.run(
                     [fpgaprog, "-v", "-f", bitstream_filename], check=True)
+                return
+
+            spi = [fpgaprog, "-v", "-f", bitstream_filename, "-b", "shared/board/bscan_spi_lx9.bit"]
+            if (not options.get("force") and programmedHash("flash") == digest):
+                print("FpgaDevBoard: bitstream already in flash, verifying only")
+                if (subprocess.run(spi + ["-sv", "-r"]).returncode == 0):
+                    return
+                print("FpgaDevBoard: flash verify failed, programming")
+
+            subprocess.run(spi + ["-sa", "-r"], check=True)
+            recordProgrammed("flash", digest)
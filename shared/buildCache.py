@@ -0,0 +1,170 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+from nmigen._toolchain import tool_env_var
+from nmigen.build.run import LocalBuildProducts
+
+# cache dos bitstreams indexado pelo hash do plano de build (verilog, ucf,
+# script do xst e comandos com as opcoes de cada ferramenta). o top.debug.v
+# fica de fora: ele guarda os atributos src="main.py:linha", e mudar um
+# comentario ou o diretorio do checkout nao muda o bitstream. a variavel
+# build_cache troca o diretorio, ou desliga o cache com build_cache=off
+CACHE_DIR = os.path.expanduser("~/.cache/nmigen-playground")
+CACHE_SIZE = 16
+
+
+def cacheDir():
+    return os.environ.get("build_cache", CACHE_DIR)
+
+
+def planKey(plan, platform):
+    hasher = hashlib.sha256()
+    for filename in sorted(plan.files):
+        if (filename.endswith(".debug.v")):
+            continue
+        content = plan.files[filename]
+        if (isinstance(content, str)):
+            content = content.encode()
+        hasher.update("{}\n{}\n".format(filename, len(content)).encode())
+        hasher.update(content)
+    hasher.update(plan.script.encode())
+    # o mesmo plano com outra versao do ISE gera outro bitstream
+    for var in [platform._toolchain_env_var] + \
+            [tool_env_var(tool) for tool in platform.required_tools]:
+        hasher.update("{}={}\n".format(var, os.environ.get(var, "")).encode())
+    return hasher.hexdigest()[:32]
+
+
+def evict(root, size):
+    # LRU: cada acerto atualiza o mtime da entrada, sai a mais antiga
+    entries = [os.path.join(root, e) for e in os.listdir(root)]
+    entries = [e for e in entries if os.path.isdir(e) and not e.endswith(".tmp")]
+    entries.sort(key=os.path.getmtime)
+    for entry in entries[:max(0, len(entries) - size)]:
+        shutil.rmtree(entry, ignore_errors=True)
+
+
+def cachedBuild(plan, platform, buildDir, outputs, execute):
+    # devolve (products, hit). `outputs` sao os arquivos guardados no cache;
+    # `execute` roda o fluxo completo quando o plano ainda nao foi visto
+    root = cacheDir()
+    if (root == "off"):
+        return execute(), False
+
+    key = planKey(plan, platform)
+    entry = os.path.join(root, key)
+
+    if (os.path.isdir(entry)):
+        # escreve os fontes e copia os resultados, sem rodar o ISE
+        plan.execute_local(buildDir, run_script=False)
+        for filename in os.listdir(entry):
+            shutil.copy(os.path.join(entry, filename), os.path.join(buildDir, filename))
+        os.utime(entry)
+        print("build cache: hit {}".format(key))
+        return LocalBuildProducts(os.path.abspath(buildDir)), True
+
+    products = execute()
+
+    os.makedirs(root, exist_ok=True)
+    tmp = "{}.{}.tmp".format(entry, os.getpid())
+    os.makedirs(tmp)
+    for filename in outputs:
+        try:
+            content = products.get(filename)
+        except FileNotFoundError:
+            continue
+        with open(os.path.join(tmp, filename), "wb") as f:
+            f.write(content)
+
+    # rename atomico: dois builds iguais em paralelo nao corrompem a entrada
+    try:
+        os.rename(tmp, entry)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    size = int(os.environ.get("build_cache_size", CACHE_SIZE))
+    evict(root, size)
+    return products, False
+
+
+# hash do ultimo bitstream gravado em cada alvo da placa (flash), junto
+# do cache; com build_cache=off continua no diretorio padrao
+PROGRAM_STATE = "programmed.json"
+
+
+def _programStatePath():
+    root = cacheDir()
+    if (root == "off"):
+        root = CACHE_DIR
+    return os.path.join(root, PROGRAM_STATE)
+
+
+def _programState():
+    path = _programStatePath()
+    if (not os.path.exists(path)):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def programmedHash(target):
+    return _programState().get(target)
+
+
+def recordProgrammed(target, digest):
+    state = _programState()
+    state[target] = digest
+    path = _programStatePath()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(state, f, indent=1)
+
+
+# design pequeno para o checkKey, compilado com o codigo em linhas diferentes
+_SAMPLE = """
+class Sample(Elaboratable):
+    def elaborate(self, platform):
+        m = Module()
+        led = platform.request("led", 0)
+        counter = Signal(24)
+        m.d.sync += counter.eq(counter + 1)
+        m.d.comb += led.o.eq(counter[-1])
+        return m
+"""
+
+
+def checkKey():
+    # mover linhas no main.py (um comentario a mais) nao muda a chave
+    from shared.board.fpga_dev_board import FpgaDevBoard
+
+    plans = []
+    for offset in [0, 10]:
+        scope = {}
+        exec("from nmigen import *", scope)
+        exec(compile("\n" * offset + _SAMPLE, "main.py", "exec"), scope)
+        platform = FpgaDevBoard()
+        plans.append((platform.build(scope["Sample"](), do_build=False), platform))
+
+    assert plans[0][0].files["top.debug.v"] != plans[1][0].files["top.debug.v"]
+    keys = [planKey(plan, platform) for plan, platform in plans]
+    assert keys[0] == keys[1], keys
+    print("plan key ok")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="cache dos builds")
+    parser.add_argument('-c', '--check', action='store_true',
+                        help='check that moving source lines keeps the cache key')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if (args.check):
+        checkKey()
+        sys.exit(0)
@@ -0,0 +1,248 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+# piora aceita entre dois builds antes de avisar (5%)
+TOLERANCE = 0.05
+
+
+def parseTiming(twr):
+    # relatorio do trce (.twr): periodo minimo, fmax, pior slack de setup
+    # e de hold e erros. as linhas "Slack: ... (period - min period limit)"
+    # sao dos component switching limits e nao entram no slack
+    report = {
+        'period': None,
+        'fmax': None,
+        'slack': None,
+        'holdSlack': None,
+        'errors': None
+    }
+
+    match = re.search(r'Minimum period:\s+([\d.]+)ns.*?Maximum frequency:\s+([\d.]+)MHz', twr)
+    if (match):
+        report['period'] = float(match.group(1))
+        report['fmax'] = float(match.group(2))
+
+    for key, path in [('slack', 'setup'), ('holdSlack', 'hold')]:
+        slacks = re.findall(r'^\s*Slack \({} path\):\s+(-?[\d.]+)ns'.format(path),
+                            twr, re.MULTILINE)
+        if (slacks):
+            report[key] = min(float(s) for s in slacks)
+
+    match = re.search(r'Timing errors:\s+(\d+)', twr)
+    if (match):
+        report['errors'] = int(match.group(1))
+
+    return report
+
+
+def _number(text):
+    return int(text.replace(',', ''))
+
+
+def parseMap(mrp):
+    # relatorio do map (.mrp): resumo do design e, com map -detail, a
+    # secao "Utilization by Hierarchy" com o uso de cada submodulo
+    report = {
+        'ffs': None,
+        'luts': None,
+        'slices': None,
+        'brams': None,
+        'modules': {}
+    }
+
+    fields = [
+        ('ffs', r'Number of Slice Registers:\s+([\d,]+)'),
+        ('luts', r'Number of Slice LUTs:\s+([\d,]+)'),
+        ('slices', r'Number of occupied Slices:\s+([\d,]+)')
+    ]
+    for key, pattern in fields:
+        match = re.search(pattern, mrp)
+        if (match):
+            report[key] = _number(match.group(1))
+
+    # uma RAMB16 ocupa o lugar de duas RAMB8
+    ram16 = re.search(r'Number of RAMB16BWERs:\s+([\d,]+)', mrp)
+    ram8 = re.search(r'Number of RAMB8BWERs:\s+([\d,]+)', mrp)
+    if (ram16 or ram8):
+        report['brams'] = (_number(ram16.group(1)) if ram16 else 0) + \
+            (_number(ram8.group(1)) if ram8 else 0) / 2
+
+    section = mrp.rsplit('Utilization by Hierarchy', 1)
+    if (len(section) == 2):
+        header = None
+        for line in section[1].splitlines():
+            if (line.startswith('Section ')):
+                break
+            if (not line.startswith('|')):
+                continue
+
+            columns = [c.strip() for c in line.strip('|').split('|')]
+            if (header == None):
+                header = columns
+                continue
+
+            row = dict(zip(header, columns))
+            name = row.get('Full Hierarchical Name')
+            if (not name):
+                continue
+
+            # cada coluna vem como "proprio/total"; guarda o total da hierarquia
+            usage = {}
+            for key, column in [('slices', 'Slices*'), ('ffs', 'Slice Reg'),
+                                ('luts', 'LUTs'), ('brams', 'BRAM/FIFO')]:
+                value = row.get(column, '')
+                if ('/' in value):
+                    usage[key] = _number(value.split('/')[1])
+            report['modules'][name] = usage
+
+    return report
+
+
+def _read(products, filename):
+    try:
+        return products.get(filename, "t")
+    except Exception:
+        return None
+
+
+def readReports(products, name):
+    report = {}
+
+    mrp = _read(products, "{}_map.mrp".format(name))
+    if (mrp != None):
+        report.update(parseMap(mrp))
+
+    twr = _read(products, "{}.twr".format(name))
+    if (twr != None):
+        report.update(parseTiming(twr))
+
+    return report
+
+
+def regressions(previous, current):
+    # compara com o build anterior do mesmo design
+    warnings = []
+
+    def worse(key, value, before, higherIsBetter):
+        if (value == None or before == None or before == 0):
+            return
+        change = (value - before) / abs(before)
+        if ((-change if higherIsBetter else change) > TOLERANCE):
+            warnings.append("{}: {} -> {} ({:+.1f}%)".format(
+                key, before, value, 100 * change))
+
+    worse('fmax', current.get('fmax'), previous.get('fmax'), True)
+    for key in ['luts', 'ffs', 'slices', 'brams']:
+        worse(key, current.get(key), previous.get(key), False)
+
+    previousModules = previous.get('modules', {})
+    for module, usage in current.get('modules', {}).items():
+        for key, value in usage.items():
+            worse("{} {}".format(module, key), value,
+                  previousModules.get(module, {}).get(key), False)
+
+    for key in ['slack', 'holdSlack']:
+        if (current.get(key) != None and current[key] < 0):
+            warnings.append("{}: {}ns, timing not met".format(key, current[key]))
+    if (current.get('errors')):
+        warnings.append("{} timing errors".format(current['errors']))
+
+    return warnings
+
+
+def loadHistory(path):
+    if (not os.path.exists(path)):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def recordBuild(products, name, buildDir, platform):
+    # chamado pela FpgaDevBoard depois de cada build: guarda fmax, slack e
+    # recursos em <buildDir>/history.json e avisa se algo piorou
+    report = readReports(products, name)
+    if (not report):
+        return None
+
+    entry = {
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'design': os.path.basename(os.getcwd()),
+        'name': name,
+        'clock': platform.default_clk_frequency / 1e6,
+        **report
+    }
+
+    path = os.path.join(buildDir, 'history.json')
+    history = loadHistory(path)
+
+    previous = [e for e in history if e['design'] == entry['design'] and e['name'] == name]
+    if (previous):
+        for warning in regressions(previous[-1], entry):
+            print("build regression: {}".format(warning))
+
+    history.append(entry)
+    with open(path, 'w') as f:
+        json.dump(history, f, indent=1)
+
+    print("{}: fmax {} MHz, slack {} ns, {} LUTs, {} FFs, {} BRAMs".format(
+        entry['design'], entry.get('fmax'), entry.get('slack'),
+        entry.get('luts'), entry.get('ffs'), entry.get('brams')))
+    return entry
+
+
+def checkSamples():
+    # confere os parsers com trechos reais do trce e do map em reportSamples
+    samples = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reportSamples')
+    with open(os.path.join(samples, 'top.twr')) as f:
+        timing = parseTiming(f.read())
+    with open(os.path.join(samples, 'top_map.mrp')) as f:
+        usage = parseMap(f.read())
+
+    # o slack do component switching limit (32.170ns) nao conta
+    assert timing == {'period': 34.012, 'fmax': 29.401, 'slack': -0.112,
+                      'holdSlack': 0.422, 'errors': 1}, timing
+    assert (usage['ffs'], usage['luts'], usage['slices'], usage['brams']) == \
+        (1123, 456, 180, 1.5), usage
+    assert usage['modules']['top/uartRx'] == {'slices': 14, 'ffs': 38, 'luts': 41, 'brams': 0}
+    assert usage['modules']['top'] == {'slices': 180, 'ffs': 1123, 'luts': 456, 'brams': 2}
+
+    previous = {'fmax': 33.0, 'luts': 456, 'modules': {'top/uartRx': {'luts': 30}}}
+    warnings = regressions(previous, {**usage, **timing})
+    assert any(w.startswith('fmax') for w in warnings), warnings
+    assert any(w.startswith('top/uartRx luts') for w in warnings), warnings
+    assert any(w.startswith('slack') for w in warnings), warnings
+    assert not any(w.startswith('holdSlack') for w in warnings), warnings
+    print("report samples ok")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="historico dos builds")
+    parser.add_argument('history', nargs='?', default='build/history.json')
+    parser.add_argument('-n', '--count', type=int, default=10)
+    parser.add_argument('-m', '--modules', action='store_true')
+    parser.add_argument('-c', '--check', action='store_true',
+                        help='check the report parsers against reportSamples')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if (args.check):
+        checkSamples()
+        sys.exit(0)
+
+    print('{:<20}{:<12}{:>9}{:>9}{:>8}{:>8}{:>7}'.format(
+        'time', 'design', 'fmax', 'slack', 'LUTs', 'FFs', 'BRAMs'))
+    for entry in loadHistory(args.history)[-args.count:]:
+        print('{:<20}{:<12}{:>9}{:>9}{:>8}{:>8}{:>7}'.format(
+            entry['time'], entry['design'], str(entry.get('fmax')), str(entry.get('slack')),
+            str(entry.get('luts')), str(entry.get('ffs')), str(entry.get('brams'))))
+        if (args.modules):
+            for module, usage in sorted(entry.get('modules', {}).items()):
+                print('    {:<44}{:>8}{:>8}'.format(
+                    module, str(usage.get('luts')), str(usage.get('ffs'))))
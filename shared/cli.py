@@ -0,0 +1,36 @@
+from argparse import ArgumentParser
+
+
+def designParser():
+    # subcomandos comuns aos main.py; cada design acrescenta os simulate*.
+    # os parsers do build e do program ficam em p_action.choices
+    parser = ArgumentParser()
+    p_action = parser.add_subparsers(dest='action')
+    p_action.add_parser('build')
+    p_program = p_action.add_parser('program')
+
+    p_program.add_argument('-f', '--flash',
+                           help='save the bitstream in flash',
+                           action='store_true')
+    p_program.add_argument('-F', '--force',
+                           help='rewrite the flash even if it already holds this bitstream',
+                           action='store_true')
+
+    return parser, p_action
+
+
+def boardAction(args, top):
+    # build e program de qualquer design; `top(platform)` cria o modulo.
+    # a platform (e o vendor do ISE) so e importada quando precisa
+    if (args.action not in ('build', 'program')):
+        return False
+
+    from shared.board.fpga_dev_board import FpgaDevBoard
+    platform = FpgaDevBoard()
+
+    if (args.action == 'build'):
+        platform.build(top(platform))
+    else:
+        platform.build(top(platform), do_program=True,
+                       program_opts={"flash": args.flash, "force": args.force})
+    return True
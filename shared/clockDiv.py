@@ -1,16 +1,26 @@
 from nmigen import *
 
 
+def timeScale(platform):
+    # simulacao acelerada: a SimPlatform encurta os divisores por este fator
+    return getattr(platform, 'timeScale', 1)
+
+
 class ClockDiv(Elaboratable):
-    def __init__(self, divideBy=1):
+    def __init__(self, divideBy=1, scalable=True):
         self.o_clk = Signal()
         self.divideBy = divideBy
+        self.scalable = scalable
 
     def elaborate(self, platform):
+        divideBy = self.divideBy
+        if (self.scalable):
+            divideBy = max(0, int(round((divideBy + 1) / timeScale(platform))) - 1)
+
         m = Module()
-        counter = Signal(max=self.divideBy + 1)
+        counter = Signal(max=divideBy + 1)
 
-        with m.If(counter == self.divideBy):
+        with m.If(counter == divideBy):
             m.d.sync += counter.eq(0)
             m.d.sync += self.o_clk.eq(1)
         with m.Else():
@@ -21,22 +31,27 @@ class ClockDiv(Elaboratable):
 
 
 class ClockDivWE(Elaboratable):
-    def __init__(self, divideBy=10, targetFreq=None):
+    def __init__(self, divideBy=10, targetFreq=None, scalable=True):
         self.o_clk = Signal()
         self.i_enable = Signal()
         self.divideBy = divideBy
         self.targetFreq = targetFreq
+        self.scalable = scalable
 
     def elaborate(self, platform):
         if (platform):
             if (self.targetFreq != None):
                 self.divideBy = int(platform.default_clk_frequency // self.targetFreq)
-                
+
+        divideBy = self.divideBy
+        if (self.scalable):
+            divideBy = max(0, int(round((divideBy + 1) / timeScale(platform))) - 1)
+
         m = Module()
-        counter = Signal(max=self.divideBy + 1)
+        counter = Signal(max=divideBy + 1)
 
         with m.If(self.i_enable):
-            with m.If(counter == self.divideBy):
+            with m.If(counter == divideBy):
                 m.d.sync += counter.eq(0)
                 m.d.sync += self.o_clk.eq(1)
             with m.Else():
@@ -48,3 +63,71 @@ class ClockDivWE(Elaboratable):
             m.d.sync += self.o_clk.eq(0)
 
         return m
+
+
+class ClockDivNCO(Elaboratable):
+    def __init__(self, divideBy=10, targetFreq=None, fracBits=16, periodBits=None,
+                 scalable=True):
+        self.o_clk = Signal()
+        self.i_enable = Signal()
+        self.divideBy = divideBy
+        self.targetFreq = targetFreq
+        self.fracBits = fracBits
+        self.scalable = scalable
+
+        # com periodBits o periodo vem de i_period em tempo de execucao
+        self.periodBits = periodBits
+        if (periodBits != None):
+            self.i_period = Signal(periodBits)
+
+        self.achievedFreq = None
+        self.errorPpm = None
+
+    def elaborate(self, platform):
+        if (platform):
+            if (self.targetFreq != None):
+                self.divideBy = platform.default_clk_frequency / self.targetFreq
+
+        # acumulador de fase: avanca um ciclo de clock por ciclo e da a
+        # volta no periodo, em ponto fixo com fracBits bits fracionarios
+        one = 1 << self.fracBits
+
+        if (self.periodBits != None):
+            period = self.i_period
+            phase = Signal(self.periodBits)
+            nextPhase = Signal(self.periodBits + 1)
+
+        else:
+            period = int(round(self.divideBy * one))
+            assert period >= one, "target frequency above the clock frequency"
+
+            if (self.scalable):
+                period = max(one, int(round(period / timeScale(platform))))
+
+            if (platform):
+                self.achievedFreq = platform.default_clk_frequency * one / period
+                if (self.targetFreq != None):
+                    self.errorPpm = (self.achievedFreq / self.targetFreq - 1) * 1e6
+                    print("ClockDivNCO: {:.3f} Hz for {} Hz ({:+.3f} ppm)".format(
+                        self.achievedFreq, self.targetFreq, self.errorPpm))
+
+            phase = Signal(max=period)
+            nextPhase = Signal(max=period + one)
+
+        m = Module()
+
+        m.d.comb += nextPhase.eq(phase + one)
+
+        with m.If(self.i_enable):
+            with m.If(nextPhase >= period):
+                m.d.sync += phase.eq(nextPhase - period)
+                m.d.sync += self.o_clk.eq(1)
+            with m.Else():
+                m.d.sync += phase.eq(nextPhase)
+                m.d.sync += self.o_clk.eq(0)
+
+        with m.Else():
+            m.d.sync += phase.eq(0)
+            m.d.sync += self.o_clk.eq(0)
+
+        return m
@@ -0,0 +1,51 @@
+import os
+import re
+import subprocess
+import tempfile
+
+from nmigen import *
+from nmigen.back import rtlil
+
+
+def designPorts(design):
+    # as portas seguem a convencao i_/o_ dos modulos do repositorio
+    ports = []
+    for name, value in vars(design).items():
+        if (not name.startswith(('i_', 'o_'))):
+            continue
+        if (isinstance(value, Signal)):
+            ports.append(value)
+        elif (isinstance(value, list)):
+            ports += [v for v in value if isinstance(v, Signal)]
+    return ports
+
+
+def resourceUsage(design, platform=None, family='xc6s'):
+    # sintetiza so este modulo com o yosys e conta LUTs e flip-flops
+    ilang = rtlil.convert(design, platform=platform, ports=designPorts(design))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'design.il')
+        with open(path, 'w') as f:
+            f.write(ilang)
+
+        output = subprocess.run(
+            ['yosys', '-p', 'synth_xilinx -family {} -flatten; stat'.format(family), path],
+            stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+
+    cells = {}
+    for name, count in re.findall(r'^\s+(\w+)\s+(\d+)$', output, re.MULTILINE):
+        cells[name] = int(count)
+
+    return {
+        'luts': sum(n for cell, n in cells.items() if re.match(r'LUT\d$', cell)),
+        'ffs': sum(n for cell, n in cells.items() if cell.startswith('FD')),
+        'cells': cells
+    }
+
+
+def printUsage(designs, platform=None):
+    print('{:<32}{:>8}{:>8}'.format('module', 'LUTs', 'FFs'))
+    for name, design in designs:
+        usage = resourceUsage(design, platform)
+        print('{:<32}{:>8}{:>8}'.format(name, usage['luts'], usage['ffs']))
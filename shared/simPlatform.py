@@ -0,0 +1,19 @@
+from nmigen import *
+from nmigen.back.pysim import Simulator
+
+
+class SimPlatform:
+    # platform so para simulacao: mesmo clock da placa, mas os timers
+    # (ClockDiv* com scalable=True) ficam timeScale vezes mais curtos
+    def __init__(self, timeScale=1000, clkFrequency=None):
+        if (clkFrequency == None):
+            # o vendor do ISE so e importado quando precisa do clock da placa
+            from shared.board.fpga_dev_board import FpgaDevBoard
+            clkFrequency = FpgaDevBoard().default_clk_frequency
+        self.default_clk_frequency = clkFrequency
+        self.timeScale = timeScale
+
+    def simulator(self, design):
+        sim = Simulator(Fragment.get(design, self))
+        sim.add_clock(1 / self.default_clk_frequency)
+        return sim
@@ -0,0 +1,74 @@
+from nmigen import *
+
+from shared.clockDiv import timeScale
+
+# sem platform: timers curtos para a simulacao, 1ms vira 10 ciclos
+SIM_CLK_FREQUENCY = 10000
+
+
+class Timebase(Elaboratable):
+    # base de tempo compartilhada: os modulos pedem um tick com tick(freq)
+    # no construtor e recebem um pulso de um ciclo nessa frequencia. as
+    # taxas sao geradas em cascata: cada uma conta os ticks da maior taxa
+    # ja gerada cujo periodo divide o seu, em vez de um contador largo
+    # contando o clock para cada modulo
+    def __init__(self, clkFrequency=SIM_CLK_FREQUENCY):
+        # clkFrequency so vale sem platform
+        self.clkFrequency = clkFrequency
+        self.ticks = {}
+
+    def tick(self, freq, scalable=True):
+        # scalable=False mantem o periodo real com a SimPlatform (baud rates)
+        key = (freq, scalable)
+        if (key not in self.ticks):
+            self.ticks[key] = Signal(name="tick_{}hz".format(
+                str(freq).replace('.', '_')))
+        return self.ticks[key]
+
+    def elaborate(self, platform):
+        m = Module()
+
+        clkFrequency = platform.default_clk_frequency if platform else self.clkFrequency
+
+        requests = []
+        for (freq, scalable), tick in self.ticks.items():
+            cycles = clkFrequency / freq
+            if (scalable):
+                cycles /= timeScale(platform)
+            requests.append((max(1, int(round(cycles))), tick))
+
+        # do periodo mais curto para o mais longo: (periodo em ciclos, pulso)
+        built = []
+        for cycles, tick in sorted(requests, key=lambda r: r[0]):
+            sourceCycles, source = 1, None
+            for c, s in built:
+                if (cycles % c == 0 and c > sourceCycles):
+                    sourceCycles, source = c, s
+
+            count = cycles // sourceCycles
+
+            if (count == 1):
+                m.d.comb += tick.eq(1 if source is None else source)
+
+            elif (source is None):
+                counter = Signal(max=count, name="{}_counter".format(tick.name))
+                with m.If(counter == count - 1):
+                    m.d.sync += [
+                        counter.eq(0),
+                        tick.eq(1)
+                    ]
+                with m.Else():
+                    m.d.sync += [
+                        counter.eq(counter + 1),
+                        tick.eq(0)
+                    ]
+
+            else:
+                counter = Signal(max=count, name="{}_counter".format(tick.name))
+                with m.If(source):
+                    m.d.sync += counter.eq(Mux(counter == count - 1, 0, counter + 1))
+                m.d.comb += tick.eq(source & (counter == count - 1))
+
+            built.append((cycles, tick))
+
+        return m
@@ -0,0 +1,61 @@
+from nmigen.back.pysim import Delay, Tick
+
+
+class UartBfm:
+    # modelo da linha serial para os testbenches: envia e recebe bytes
+    # inteiros e pula os ciclos de cada bit de uma vez, sem acordar o
+    # processo a cada clock. bitCycles pode ser fracionario
+    def __init__(self, bitCycles=16, clkPeriod=1e-6):
+        self.bitCycles = bitCycles
+        self.clkPeriod = clkPeriod
+        self.cycles = 0
+
+    def wait(self, cycles):
+        # o mesmo que `cycles` yields num sync process
+        if (cycles <= 0):
+            return
+        if (cycles > 1):
+            yield Delay((cycles - 0.5) * self.clkPeriod)
+        yield Tick()
+        self.cycles += cycles
+
+    def send(self, line, data, gapCycles=0):
+        for byte in data:
+            position = 0
+            for n, bit in enumerate([0] + [(byte >> i) & 1 for i in range(8)] + [1]):
+                yield line.eq(bit)
+                end = int(round((n + 1) * self.bitCycles))
+                yield from self.wait(end - position)
+                position = end
+            yield from self.wait(gapCycles)
+
+    def receive(self, line, count, timeout=None):
+        # a linha parada e olhada a cada `step` ciclos; o start bit pode
+        # ser visto ate `step` ciclos atrasado, compensado na amostragem
+        step = max(1, int(self.bitCycles) // 8)
+        received = []
+        idle = 0
+
+        while len(received) < count:
+            if (yield line):
+                if (timeout != None and idle >= timeout):
+                    raise AssertionError("uart timeout after {} of {} bytes".format(
+                        len(received), count))
+                yield from self.wait(step)
+                idle += step
+                continue
+
+            bits = []
+            position = 0
+            for n in range(10):
+                sample = int(round((n + 0.5) * self.bitCycles)) - step // 2
+                yield from self.wait(sample - position)
+                position = sample
+                bits.append((yield line))
+
+            assert bits[0] == 0, "false start bit"
+            assert bits[9] == 1, "framing error in byte {}".format(len(received))
+            received.append(sum(bit << i for i, bit in enumerate(bits[1:9])))
+            idle = 0
+
+        return received
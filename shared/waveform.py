@@ -0,0 +1,130 @@
+from collections import deque
+from fnmatch import fnmatch
+
+from nmigen.hdl.ast import SignalDict
+from nmigen.back.pysim import _VCDWaveformWriter, _WaveformContextManager
+
+
+def addTraceArgs(p_action):
+    # opcoes de waveform em todas as acoes simulate*
+    for name, parser in p_action.choices.items():
+        if (not name.startswith('simulate')):
+            continue
+        group = parser.add_argument_group('waveform')
+        group.add_argument('--trace', action='append', metavar='PATTERN',
+                           help='only dump signals matching this pattern, '
+                                'e.g. "top.main.uartRx.*" (repeatable)')
+        group.add_argument('--exclude', action='append', metavar='PATTERN',
+                           help='do not dump signals matching this pattern (repeatable)')
+        group.add_argument('--trigger', action='append', metavar='PATTERN[=VALUE]',
+                           help='only dump windows around the moments a matching '
+                                'signal becomes nonzero (or VALUE)')
+        group.add_argument('--pre', type=float, default=10,
+                           help='microseconds kept before each trigger')
+        group.add_argument('--post', type=float, default=10,
+                           help='microseconds dumped after each trigger')
+        group.add_argument('--ring', type=int, default=None,
+                           help='keep at most this many changes before a trigger')
+        group.add_argument('--no-vcd', dest='vcd', action='store_false',
+                           help='do not write test.vcd')
+
+
+def _matches(names, patterns):
+    # um sinal pode aparecer em mais de um escopo (porta de submodulo)
+    return any(fnmatch('.'.join(str(n) for n in name), pattern)
+               for name in names for pattern in patterns)
+
+
+class _FilteredWriter(_VCDWaveformWriter):
+    # escreve so os sinais escolhidos e, com gatilhos, so as janelas de
+    # pre/post segundos em volta de cada disparo. fora das janelas as
+    # mudancas ficam num buffer circular que cobre os ultimos `pre` segundos
+    def __init__(self, signal_names, *, vcd_file, gtkw_file=None, traces=(),
+                 triggers=(), pre=0, post=0, ring=None):
+        super().__init__(signal_names, vcd_file=vcd_file, gtkw_file=gtkw_file,
+                         traces=traces)
+        self.triggers = SignalDict(triggers)
+        self.pre = pre
+        self.post = post
+        self.buffer = deque(maxlen=ring)
+        self.values = SignalDict((s, s.reset) for s in self.vcd_vars)
+        self.shown = SignalDict(self.values.items())
+        self.windowEnd = None
+        self.lastWritten = 0.0
+
+    def write(self, timestamp, signal, value):
+        if (self.shown[signal] != value):
+            super().update(timestamp, signal, value)
+            self.shown[signal] = value
+        self.lastWritten = timestamp
+
+    def trigger(self, timestamp):
+        # estado dos sinais no inicio da janela: desfaz as mudancas do buffer
+        start = max(timestamp - self.pre, self.lastWritten)
+        while (self.buffer and self.buffer[0][0] < start):
+            self.buffer.popleft()
+
+        state = SignalDict(self.values.items())
+        for _, signal, _, previous in reversed(self.buffer):
+            state[signal] = previous
+        for signal, value in state.items():
+            self.write(start, signal, value)
+
+        for ts, signal, value, _ in self.buffer:
+            self.write(ts, signal, value)
+        self.buffer.clear()
+
+    def update(self, timestamp, signal, value):
+        if (not self.triggers):
+            return super().update(timestamp, signal, value)
+
+        if (signal in self.triggers):
+            condition = self.triggers[signal]
+            if (value != 0 if condition == None else value == condition):
+                if (self.windowEnd == None or timestamp > self.windowEnd):
+                    self.trigger(timestamp)
+                self.windowEnd = max(self.windowEnd or 0, timestamp + self.post)
+
+        if (signal not in self.vcd_vars):
+            return
+
+        if (self.windowEnd != None and timestamp <= self.windowEnd):
+            self.write(timestamp, signal, value)
+        else:
+            self.buffer.append((timestamp, signal, value, self.values[signal]))
+            while (self.buffer and self.buffer[0][0] < timestamp - self.pre):
+                self.buffer.popleft()
+        self.values[signal] = value
+
+
+def traceVcd(sim, args=None, vcdFile="test.vcd", gtkwFile="test.gtkw", traces=(),
+             include=None, exclude=None, triggers=None, pre=10, post=10, ring=None):
+    # substitui o sim.write_vcd: com as opcoes de addTraceArgs (ou os
+    # argumentos equivalentes) filtra os sinais e grava so as janelas em
+    # volta dos gatilhos. sem opcoes o resultado e o mesmo do write_vcd
+    if (args != None):
+        if (not args.vcd):
+            return _WaveformContextManager(sim._state, None)
+        include, exclude, triggers = args.trace, args.exclude, args.trigger
+        pre, post, ring = args.pre, args.post, args.ring
+
+    names = SignalDict()
+    for signal, signalNames in sim._signal_names.items():
+        if (include and not _matches(signalNames, include)):
+            continue
+        if (exclude and _matches(signalNames, exclude)):
+            continue
+        names[signal] = signalNames
+
+    triggerValues = []
+    for pattern in (triggers or []):
+        pattern, _, value = pattern.partition('=')
+        matched = [s for s, n in sim._signal_names.items() if _matches(n, [pattern])]
+        assert matched, "no signal matches trigger {}".format(pattern)
+        triggerValues += [(s, int(value, 0) if value else None) for s in matched]
+
+    writer = _FilteredWriter(names, vcd_file=vcdFile, gtkw_file=gtkwFile,
+                             traces=[t for t in traces if t in names],
+                             triggers=triggerValues, pre=pre * 1e-6,
+                             post=post * 1e-6, ring=ring)
+    return _WaveformContextManager(sim._state, writer)
@@ -0,0 +1,188 @@
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser, SUPPRESS
+
+# benchmark do pysim: para cada design mede o tempo de elaboracao, o de
+# compilacao do simulador, ciclos simulados por segundo e a memoria usada
+# pelo design. cada medida roda num processo proprio (os main.py tem o
+# mesmo nome de modulo e o pico de memoria e do processo), em serie
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# (design, nome, expressao avaliada no main.py do design)
+BENCHMARKS = [
+    ('blink', 'Main', 'Main()'),
+    ('debouncer', 'Debouncer', 'Debouncer()'),
+    ('debouncer', 'MultiDebouncer', 'MultiDebouncer()'),
+    ('7seg', 'BinaryToDecimalConverter', 'BinaryToDecimalConverter()'),
+    ('7seg', 'PipelinedBinaryToDecimal', 'PipelinedBinaryToDecimal()'),
+    ('7seg', 'SevenSegmentsDisplay', 'SevenSegmentsDisplay()'),
+    ('7seg', 'DisplayEngine', 'DisplayEngine()'),
+    ('uart', 'UartTX', 'UartTX()'),
+    ('uart', 'UartRx', 'UartRx()'),
+    ('uart', 'UartBridge', 'UartBridge()'),
+    ('uart', 'HelloWorld', 'HelloWorld()'),
+    ('uart', 'Main', 'Main()'),
+]
+
+# piora aceita em relacao ao baseline
+TOLERANCE = 0.15
+
+
+def runBenchmark(design, expression, cycles):
+    # roda dentro do processo filho, no diretorio do design
+    sys.path.insert(0, os.path.join(ROOT, design))
+    import main
+    from nmigen import Fragment, Signal
+    from nmigen.back.pysim import Simulator, Passive
+
+    # o interpretador e o nmigen ja ocupam dezenas de MB: conta so o que
+    # o pico cresce a partir daqui
+    baseRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    top = eval(expression, vars(main))
+    fragment = Fragment.get(top, None)
+    elaborate = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sim = Simulator(fragment)
+    sim.add_clock(1e-6)
+    simCompile = time.perf_counter() - start
+
+    # entradas i_ aleatorias (semente fixa) para o design ter atividade
+    inputs = [p for name, p in vars(top).items()
+              if name.startswith('i_') and isinstance(p, Signal)]
+    rng = random.Random(0)
+
+    def stimulus():
+        yield Passive()
+        while True:
+            for port in inputs:
+                yield port.eq(rng.getrandbits(len(port)))
+            yield
+
+    if (inputs):
+        sim.add_sync_process(stimulus)
+
+    start = time.perf_counter()
+    sim.run_until(cycles * 1e-6, run_passive=True)
+    run = time.perf_counter() - start
+
+    return {
+        'elaborate': elaborate,
+        'compile': simCompile,
+        'cyclesPerSecond': cycles / run,
+        'memoryKb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseRss
+    }
+
+
+def measure(design, expression, cycles, repeat):
+    # melhor de `repeat` execucoes; a memoria e o maior pico
+    best = None
+    for n in range(repeat):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run', design, expression,
+             '-c', str(cycles)],
+            cwd=os.path.join(ROOT, design), stdout=subprocess.PIPE,
+            universal_newlines=True, check=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        if (best == None):
+            best = result
+            continue
+        best['elaborate'] = min(best['elaborate'], result['elaborate'])
+        best['compile'] = min(best['compile'], result['compile'])
+        best['cyclesPerSecond'] = max(best['cyclesPerSecond'], result['cyclesPerSecond'])
+        best['memoryKb'] = max(best['memoryKb'], result['memoryKb'])
+    return best
+
+
+def regressions(baseline, results, tolerance):
+    warnings = []
+    for key, result in results.items():
+        before = baseline.get(key)
+        if (before == None):
+            continue
+        # (metrica, maior e melhor, diferenca minima): mudancas de poucos
+        # milissegundos sao ruido
+        for metric, higherIsBetter, minimum in [('cyclesPerSecond', True, 0),
+                                                ('elaborate', False, 0.01),
+                                                ('compile', False, 0.01),
+                                                ('memoryKb', False, 256)]:
+            if (abs(result[metric] - before[metric]) < minimum):
+                continue
+            change = (result[metric] - before[metric]) / max(before[metric], 1)
+            if ((-change if higherIsBetter else change) > tolerance):
+                warnings.append("{} {}: {:.4g} -> {:.4g} ({:+.1f}%)".format(
+                    key, metric, before[metric], result[metric], 100 * change))
+    return warnings
+
+
+def parse_args():
+    parser = ArgumentParser(description='simulation benchmark of every design')
+    parser.add_argument('-c', '--cycles', type=int, default=20000,
+                        help='simulated clock cycles per design')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='runs per design, the best one is kept')
+    parser.add_argument('-k', '--filter', default='',
+                        help='only benchmarks whose "design/name" contains this')
+    parser.add_argument('-o', '--output', default=os.path.join(ROOT, 'runs', 'simbench.json'))
+    parser.add_argument('-b', '--baseline', default=os.path.join(ROOT, 'simbench_baseline.json'))
+    parser.add_argument('-s', '--save-baseline', action='store_true',
+                        help='store these results as the new baseline')
+    parser.add_argument('-t', '--tolerance', type=float, default=TOLERANCE,
+                        help='relative change reported as a regression')
+    parser.add_argument('--run', nargs=2, metavar=('DESIGN', 'EXPRESSION'),
+                        help=SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if (args.run):
+        print(json.dumps(runBenchmark(args.run[0], args.run[1], args.cycles)))
+        sys.exit(0)
+
+    results = {}
+    print('{:<36}{:>10}{:>12}{:>12}{:>10}'.format(
+        'design', 'elab (s)', 'compile (s)', 'cycles/s', 'mem MB'))
+    for design, name, expression in BENCHMARKS:
+        key = '{}/{}'.format(design, name)
+        if (args.filter not in key):
+            continue
+        result = measure(design, expression, args.cycles, args.repeat)
+        results[key] = result
+        print('{:<36}{:>10.3f}{:>12.3f}{:>12.0f}{:>10.1f}'.format(
+            key, result['elaborate'], result['compile'], result['cyclesPerSecond'],
+            result['memoryKb'] / 1024))
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump({'cycles': args.cycles, 'results': results}, f, indent=1)
+
+    if (args.save_baseline):
+        with open(args.baseline, 'w') as f:
+            json.dump({'cycles': args.cycles, 'results': results}, f, indent=1)
+        print('baseline saved to {}'.format(os.path.relpath(args.baseline)))
+        sys.exit(0)
+
+    if (not os.path.exists(args.baseline)):
+        print('no baseline, run with -s to create {}'.format(os.path.relpath(args.baseline)))
+        sys.exit(0)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if (baseline['cycles'] != args.cycles):
+        print('warning: baseline simulated {} cycles'.format(baseline['cycles']))
+
+    warnings = regressions(baseline['results'], results, args.tolerance)
+    for warning in warnings:
+        print('regression: {}'.format(warning))
+    print('{} regressions against {}'.format(len(warnings), os.path.relpath(args.baseline)))
+    sys.exit(1 if warnings else 0)
@@ -0,0 +1,231 @@
+import difflib
+import os
+import random
+import select
+import threading
+import time
+import tty
+from argparse import ArgumentParser
+
+
+class SerialLink:
+    def __init__(self, port, baud):
+        import serial
+        self.ser = serial.Serial(port, baud, timeout=0)
+
+    def write(self, data):
+        self.ser.write(data)
+
+    def read(self, size, timeout):
+        self.ser.timeout = timeout
+        return self.ser.read(size)
+
+    def drain(self):
+        self.ser.reset_input_buffer()
+
+    def close(self):
+        self.ser.close()
+
+
+class PtyLink:
+    # pseudo terminal com uma thread fazendo eco, no lugar da placa
+    def __init__(self, baud=None):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.baud = baud
+        self.running = True
+        self.thread = threading.Thread(target=self.echo, daemon=True)
+        self.thread.start()
+
+    def echo(self):
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                return
+            if self.baud:
+                # 10 bits por byte na linha
+                time.sleep(len(data) * 10 / self.baud)
+            os.write(self.master, data)
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.slave, view):]
+
+    def read(self, size, timeout):
+        data = b''
+        deadline = time.monotonic() + timeout
+        while len(data) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            ready, _, _ = select.select([self.slave], [], [], remaining)
+            if ready:
+                data += os.read(self.slave, size - len(data))
+        return data
+
+    def drain(self):
+        while self.read(4096, 0.05):
+            pass
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        os.close(self.slave)
+        os.close(self.master)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    index = max(0, int(round(p / 100 * len(values))) - 1)
+    return values[index]
+
+
+def compareEcho(payload, echoed, minMatch=4):
+    # alinha o eco com o que foi enviado: um byte perdido no comeco nao
+    # faz o resto parecer corrompido. trechos iguais com menos de minMatch
+    # bytes sao coincidencia no meio de lixo e nao alinham. devolve
+    # (corrompidos, perdidos); um byte a mais no eco conta como corrompido
+    errors = 0
+    lost = 0
+    i = j = 0
+    matcher = difflib.SequenceMatcher(None, payload, echoed, autojunk=False)
+    for a, b, size in matcher.get_matching_blocks():
+        if size and size < minMatch:
+            continue
+        missing, extra = a - i, b - j
+        errors += extra
+        lost += max(0, missing - extra)
+        i, j = a + size, b + size
+    return errors, lost
+
+
+def throughput(link, size, chunk, timeout):
+    payload = bytes(random.getrandbits(8) for _ in range(size))
+    received = []
+
+    def reader():
+        total = 0
+        while total < size:
+            data = link.read(min(chunk, size - total), timeout)
+            if not data:
+                break
+            received.append(data)
+            total += len(data)
+
+    thread = threading.Thread(target=reader)
+    start = time.monotonic()
+    thread.start()
+    for offset in range(0, size, chunk):
+        link.write(payload[offset:offset + chunk])
+    thread.join()
+    elapsed = time.monotonic() - start
+
+    echoed = b''.join(received)
+    errors, lost = compareEcho(payload, echoed)
+
+    return {
+        'bytes': size,
+        'seconds': elapsed,
+        'bytes_per_second': len(echoed) / elapsed,
+        'errors': errors,
+        'lost': lost
+    }
+
+
+def latency(link, count, payloadSize, timeout):
+    rtts = []
+    errors = 0
+    lost = 0
+
+    for n in range(count):
+        payload = bytes(random.getrandbits(8) for _ in range(payloadSize))
+        start = time.monotonic()
+        link.write(payload)
+        echoed = link.read(payloadSize, timeout)
+        rtt = time.monotonic() - start
+
+        if len(echoed) < payloadSize:
+            lost += 1
+            # descarta um eco atrasado para nao contaminar o proximo
+            link.drain()
+        elif echoed != payload:
+            errors += 1
+        else:
+            rtts.append(rtt)
+
+    return {
+        'count': count,
+        'p50_ms': percentile(rtts, 50) * 1e3,
+        'p99_ms': percentile(rtts, 99) * 1e3,
+        'max_ms': max(rtts) * 1e3 if rtts else float('nan'),
+        'errors': errors,
+        'lost': lost
+    }
+
+
+def report(name, result):
+    print(name)
+    for key, value in result.items():
+        if isinstance(value, float):
+            print('  {:<18}{:.3f}'.format(key, value))
+        else:
+            print('  {:<18}{}'.format(key, value))
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('-p', '--port', default='/dev/ttyUSB1',
+                        help='serial port of the board')
+    parser.add_argument('-b', '--baud', type=int, default=115200)
+    parser.add_argument('--pty', action='store_true',
+                        help='use a pseudo terminal echo instead of the board')
+    parser.add_argument('-t', '--timeout', type=float, default=1.0,
+                        help='seconds to wait for an echo')
+
+    p_action = parser.add_subparsers(dest='action')
+    # sem acao nao mede nada
+    p_action.required = True
+
+    p_throughput = p_action.add_parser('throughput')
+    p_throughput.add_argument('-s', '--size', type=int, default=64 * 1024)
+    p_throughput.add_argument('-c', '--chunk', type=int, default=256)
+
+    p_latency = p_action.add_parser('latency')
+    p_latency.add_argument('-n', '--count', type=int, default=1000)
+    p_latency.add_argument('-s', '--size', type=int, default=1)
+
+    p_action.add_parser('all')
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.pty:
+        link = PtyLink(baud=args.baud)
+    else:
+        link = SerialLink(args.port, args.baud)
+
+    try:
+        link.drain()
+
+        if args.action in ('throughput', 'all'):
+            size = getattr(args, 'size', 64 * 1024)
+            chunk = getattr(args, 'chunk', 256)
+            report('throughput', throughput(link, size, chunk, args.timeout))
+
+        if args.action in ('latency', 'all'):
+            count = getattr(args, 'count', 1000)
+            size = getattr(args, 'size', 1)
+            report('latency', latency(link, count, size, args.timeout))
+    finally:
+        link.close()
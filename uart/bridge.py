@@ -0,0 +1,89 @@
+from argparse import ArgumentParser
+
+from bench import SerialLink
+
+ADDRESS_BITS = 16
+CMD_WRITE = 0x01
+CMD_READ = 0x02
+CMD_FIXED = 0x10
+ACK = 0x06
+MAX_BURST = 256
+
+
+class BridgeClient:
+    def __init__(self, link, timeout=1.0):
+        self.link = link
+        self.timeout = timeout
+
+    def checkRange(self, address, size, fixed):
+        # o contador de endereco do UartBridge tem 16 bits e daria a volta
+        last = address if fixed else address + size - 1
+        if address < 0 or last >= 1 << ADDRESS_BITS:
+            raise ValueError("{:#x} to {:#x} is outside the {} bit bridge address space"
+                             .format(address, last, ADDRESS_BITS))
+
+    def write(self, address, data, fixed=False):
+        self.checkRange(address, len(data), fixed)
+        command = CMD_WRITE | (CMD_FIXED if fixed else 0)
+        for offset in range(0, len(data), MAX_BURST):
+            chunk = data[offset:offset + MAX_BURST]
+            start = address if fixed else address + offset
+            self.link.write(bytes([command, start >> 8, start & 0xFF,
+                                   len(chunk) - 1]) + bytes(chunk))
+            reply = self.link.read(1, self.timeout)
+            if reply != bytes([ACK]):
+                raise IOError("write at 0x{:04x} failed: {!r}".format(start, reply))
+
+    def read(self, address, size, fixed=False):
+        self.checkRange(address, size, fixed)
+        command = CMD_READ | (CMD_FIXED if fixed else 0)
+        data = b''
+        for offset in range(0, size, MAX_BURST):
+            count = min(MAX_BURST, size - offset)
+            start = address if fixed else address + offset
+            self.link.write(bytes([command, start >> 8, start & 0xFF, count - 1]))
+            chunk = self.link.read(count, self.timeout)
+            if len(chunk) != count:
+                raise IOError("read at 0x{:04x} returned {} of {} bytes".format(
+                    start, len(chunk), count))
+            data += chunk
+        return data
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('-p', '--port', default='/dev/ttyUSB1',
+                        help='serial port of the board')
+    parser.add_argument('-b', '--baud', type=int, default=115200)
+
+    p_action = parser.add_subparsers(dest='action')
+
+    p_read = p_action.add_parser('read')
+    p_read.add_argument('address', type=lambda x: int(x, 0))
+    p_read.add_argument('size', type=lambda x: int(x, 0))
+
+    p_write = p_action.add_parser('write')
+    p_write.add_argument('address', type=lambda x: int(x, 0))
+    p_write.add_argument('data', help='hex bytes, e.g. deadbeef')
+
+    for p in (p_read, p_write):
+        p.add_argument('-f', '--fixed',
+                       help='do not increment the address',
+                       action='store_true')
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    link = SerialLink(args.port, args.baud)
+    client = BridgeClient(link)
+
+    try:
+        if args.action == 'read':
+            print(client.read(args.address, args.size, args.fixed).hex())
+
+        elif args.action == 'write':
+            client.write(args.address, bytes.fromhex(args.data), args.fixed)
+    finally:
+        link.close()
@@ -1,137 +1,645 @@
-from argparse import ArgumentParser
+import random
 
 from nmigen import *
 from nmigen.lib.cdc import FFSynchronizer
-from shared.board.fpga_dev_board import FpgaDevBoard
-from shared.clockDiv import ClockDivWE
-from nmigen.back.pysim import Simulator, Delay
+from nmigen.lib.fifo import SyncFIFOBuffered
+from shared.cli import designParser, boardAction
+from shared.clockDiv import ClockDivWE, ClockDivNCO
+from shared.simPlatform import SimPlatform
+from shared.timebase import Timebase, SIM_CLK_FREQUENCY
+from shared.uartBfm import UartBfm
+from shared.waveform import traceVcd, addTraceArgs
+from nmigen.back.pysim import Simulator, Delay, Settle, Passive
+
+
+# periodo de um bit (divisor) em ciclos de clock, ponto fixo com FRAC_BITS
+# bits fracionarios para o erro nao acumular ao longo do frame
+FRAC_BITS = 8
+DIVISOR_BITS = 24
+
+
+def baudDivisor(platform, baud):
+    if (platform):
+        return int(round(platform.default_clk_frequency * (1 << FRAC_BITS) / baud))
+
+    # sem platform cada bit dura 16 ciclos
+    return 16 << FRAC_BITS
 
 
 class UartRx(Elaboratable):
-    def __init__(self):
+    def __init__(self, baud=115200, oversampling=16, runtimeBaud=False):
         self.i_rx = Signal(reset=1)
         self.o_data = Signal(8)
         self.o_stb = Signal()
+        self.o_err = Signal()
+
+        self.baud = baud
+        self.oversampling = oversampling
+
+        # com runtimeBaud o divisor vem de i_divisor em vez de baud
+        self.runtimeBaud = runtimeBaud
+        self.i_divisor = Signal(DIVISOR_BITS)
 
     def elaborate(self, platform):
         m = Module()
 
-        baudCounter = Signal(max=5)
+        assert self.oversampling & (self.oversampling - 1) == 0, \
+            "oversampling must be a power of two"
+
+        one = 1 << FRAC_BITS
+        slotShift = self.oversampling.bit_length() - 1
+
+        # amostra os slots (n/2 - 1), n/2 e (n/2 + 1) de cada bit
+        if (self.runtimeBaud):
+            bitPeriod = self.i_divisor
+            slot = Signal(DIVISOR_BITS)
+            firstSample = Signal(DIVISOR_BITS)
+            nextBit = Signal(DIVISOR_BITS)
+
+            m.d.comb += [
+                slot.eq(Mux((bitPeriod >> slotShift) > one,
+                            bitPeriod >> slotShift, one)),
+                firstSample.eq((bitPeriod >> 1) - slot),
+                nextBit.eq(bitPeriod - 2 * slot)
+            ]
+
+            countdown = Signal(DIVISOR_BITS)
+
+        else:
+            bitPeriod = baudDivisor(platform, self.baud)
+            assert bitPeriod >= 4 * one, "baud rate too high for the clock"
+
+            slot = max(bitPeriod >> slotShift, one)
+            firstSample = bitPeriod // 2 - slot
+            nextBit = bitPeriod - 2 * slot
+
+            countdown = Signal(max=bitPeriod + 1)
+
+        sampleCounter = Signal(max=3)
         bitCounter = Signal(max=10)
+        samples = Signal(2)
+        vote = Signal()
         buffer = Signal(8)
 
         rx = Signal(reset=1)
         m.submodules += FFSynchronizer(self.i_rx, rx, reset=1)
 
-        clkDiv = ClockDivWE(targetFreq=115200 * 2)
-        m.submodules += clkDiv
+        m.d.comb += vote.eq((samples[0] & samples[1]) |
+                            (samples[0] & rx) |
+                            (samples[1] & rx))
 
-        with m.If(clkDiv.o_clk):
-            m.d.sync += baudCounter.eq(baudCounter + 1)
+        m.d.sync += [
+            self.o_stb.eq(0),
+            self.o_err.eq(0)
+        ]
 
         with m.FSM():
             with m.State('IDLE'):
-                m.d.sync += self.o_stb.eq(0)
                 with m.If(~rx):
-                    m.d.sync += clkDiv.i_enable.eq(1)
-                    m.next = 'WAIT_HALF_BAUD'
-
-            with m.State('WAIT_HALF_BAUD'):
-                with m.If(clkDiv.o_clk):
-                    m.d.sync += baudCounter.eq(0)
+                    m.d.sync += [
+                        countdown.eq(firstSample - one),
+                        sampleCounter.eq(0),
+                        bitCounter.eq(0)
+                    ]
                     m.next = 'READ'
 
             with m.State('READ'):
-                with m.If(baudCounter == 2):
-                    with m.If(bitCounter < 8):
-                        m.d.sync += [
-                            buffer.eq(Cat(buffer[1:], rx)),
-                            bitCounter.eq(bitCounter + 1),
-                            baudCounter.eq(0)
-                        ]
+                with m.If(countdown >= one):
+                    m.d.sync += countdown.eq(countdown - one)
 
-                    with m.Else():
-                        m.next = 'FINISH'
+                with m.Elif(sampleCounter < 2):
+                    m.d.sync += [
+                        samples.eq(Cat(samples[1], rx)),
+                        sampleCounter.eq(sampleCounter + 1),
+                        countdown.eq(countdown - one + slot)
+                    ]
 
-            with m.State('FINISH'):
-                with m.If(clkDiv.o_clk):
+                with m.Else():
                     m.d.sync += [
-                        self.o_stb.eq(1),
-                        self.o_data.eq(buffer),
-                        bitCounter.eq(0),
-                        baudCounter.eq(0),
-                        clkDiv.i_enable.eq(0)
+                        sampleCounter.eq(0),
+                        bitCounter.eq(bitCounter + 1),
+                        countdown.eq(countdown - one + nextBit)
                     ]
-                    m.next = 'IDLE'
+
+                    with m.If(bitCounter == 0):
+                        # start bit falso
+                        with m.If(vote):
+                            m.next = 'IDLE'
+
+                    with m.Elif(bitCounter < 9):
+                        m.d.sync += buffer.eq(Cat(buffer[1:], vote))
+
+                    with m.Else():
+                        with m.If(vote):
+                            m.d.sync += [
+                                self.o_stb.eq(1),
+                                self.o_data.eq(buffer)
+                            ]
+                        with m.Else():
+                            m.d.sync += self.o_err.eq(1)
+                        m.next = 'IDLE'
 
         return m
 
 
 class UartTX(Elaboratable):
-    def __init__(self):
+    def __init__(self, baud=115200, fractional=False, runtimeBaud=False, timebase=None):
         self.i_wr = Signal()
         self.i_data = Signal(8)
         self.o_busy = Signal()
         self.o_tx = Signal(reset=1)
 
+        self.baud = baud
+        self.fractional = fractional
+
+        # com runtimeBaud o divisor vem de i_divisor em vez de baud
+        self.runtimeBaud = runtimeBaud
+        self.i_divisor = Signal(DIVISOR_BITS)
+
+        # com uma Timebase os bits seguem um tick livre de `baud` Hz; o NCO
+        # fracionario e o divisor em runtime continuam locais
+        self.baudTick = None
+        if (timebase != None and not fractional and not runtimeBaud):
+            self.baudTick = timebase.tick(baud, scalable=False)
+
     def elaborate(self, platform):
         m = Module()
 
-        clkDiv = ClockDivWE(targetFreq=115200)
-        m.submodules += clkDiv
+        bitTick = Signal()
+        divEnable = Signal()
+        start = Signal()
+
+        if (self.baudTick is not None and platform):
+            # o tick nao para entre os frames: o start bit espera o proximo
+            # tick para durar um bit inteiro
+            m.d.comb += [
+                bitTick.eq(self.baudTick),
+                start.eq(self.baudTick)
+            ]
+        else:
+            if (self.runtimeBaud):
+                clkDiv = ClockDivNCO(fracBits=FRAC_BITS, periodBits=DIVISOR_BITS)
+                m.d.comb += clkDiv.i_period.eq(self.i_divisor)
+            elif (platform):
+                if (self.fractional):
+                    clkDiv = ClockDivNCO(targetFreq=self.baud, scalable=False)
+                else:
+                    clkDiv = ClockDivWE(targetFreq=self.baud, scalable=False)
+            else:
+                # sem platform cada bit dura 16 ciclos, como no UartRx
+                if (self.fractional):
+                    clkDiv = ClockDivNCO(divideBy=16, scalable=False)
+                else:
+                    clkDiv = ClockDivWE(divideBy=15, scalable=False)
+            m.submodules += clkDiv
+
+            m.d.comb += [
+                bitTick.eq(clkDiv.o_clk),
+                clkDiv.i_enable.eq(divEnable),
+                start.eq(1)
+            ]
 
-        busy = Signal()
-        register = Signal(8)
+        # o proximo byte espera em holding enquanto o frame atual sai
+        holding = Signal(8)
+        holdingFull = Signal()
+        register = Signal(9)
         shiftCounter = Signal(4)
 
-        m.d.comb += self.o_busy.eq(busy)
+        m.d.comb += self.o_busy.eq(holdingFull)
+
+        with m.If((self.i_wr) & (~holdingFull)):
+            m.d.sync += [
+                holding.eq(self.i_data),
+                holdingFull.eq(1)
+            ]
+
+        loadFrame = [
+            register.eq(Cat(holding, 1)),
+            holdingFull.eq(0),
+            shiftCounter.eq(0),
+            self.o_tx.eq(0)
+        ]
 
         with m.FSM():
             with m.State('IDLE'):
-                with m.If((self.i_wr) & (~busy)):
-                    m.d.sync += [
-                        register.eq(self.i_data),
-                        busy.eq(1),
-                        clkDiv.i_enable.eq(1),
-                        self.o_tx.eq(0)
-                    ]
-
+                m.d.comb += divEnable.eq(holdingFull)
+                with m.If(holdingFull & start):
+                    m.d.sync += loadFrame
                     m.next = 'SEND_DATA'
 
             with m.State('SEND_DATA'):
-                with m.If(clkDiv.o_clk):
-                    with m.If(shiftCounter < 8):
+                m.d.comb += divEnable.eq(1)
+                with m.If(bitTick):
+                    with m.If(shiftCounter < 9):
                         m.d.sync += [
                             register.eq(register >> 1),
                             self.o_tx.eq(register[0]),
                             shiftCounter.eq(shiftCounter + 1)
                         ]
 
+                    # fim do stop bit: o start bit do proximo byte sai
+                    # no mesmo ciclo, sem intervalo entre os frames
+                    with m.Elif(holdingFull):
+                        m.d.sync += loadFrame
+
                     with m.Else():
-                        m.d.sync += self.o_tx.eq(1)
-                        m.next = 'FINISH'
+                        m.next = 'IDLE'
+
+        return m
+
+
+class UartAutoBaud(Elaboratable):
+    def __init__(self, baud=115200):
+        self.i_rx = Signal(reset=1)
+        self.i_start = Signal()
+        self.i_divisor = Signal(DIVISOR_BITS)
+        self.i_we = Signal()
+        self.o_divisor = Signal(DIVISOR_BITS)
+        self.o_busy = Signal()
+        self.o_done = Signal()
+
+        self.baud = baud
+
+    def elaborate(self, platform):
+        m = Module()
+
+        divisor = Signal(DIVISOR_BITS, reset=baudDivisor(platform, self.baud))
+        m.d.comb += self.o_divisor.eq(divisor)
+
+        rx = Signal(reset=1)
+        prevRx = Signal(reset=1)
+        fell = Signal()
+        m.submodules += FFSynchronizer(self.i_rx, rx, reset=1)
+
+        m.d.sync += prevRx.eq(rx)
+        m.d.comb += fell.eq(prevRx & ~rx)
+
+        # o caractere de sincronismo 0x55 tem bordas de descida no start
+        # bit e nos bits 1, 3, 5 e 7: da primeira a quinta sao 8 bits
+        counter = Signal(DIVISOR_BITS - FRAC_BITS + 3)
+        edgeCounter = Signal(max=5)
 
-            with m.State('FINISH'):
-                with m.If(clkDiv.o_clk):
+        # e os 4 intervalos entre elas tem 2 bits: cada um precisa ficar a
+        # menos de 1/4 do primeiro, senao nao era um 0x55
+        lastEdge = Signal.like(counter)
+        firstInterval = Signal.like(counter)
+        interval = Signal.like(counter)
+        mismatch = Signal()
+        m.d.comb += [
+            interval.eq(counter - lastEdge),
+            mismatch.eq(Mux(interval > firstInterval, interval - firstInterval,
+                            firstInterval - interval) > (firstInterval >> 2))
+        ]
+
+        m.d.sync += self.o_done.eq(0)
+
+        with m.If(self.i_we):
+            m.d.sync += divisor.eq(self.i_divisor)
+
+        with m.FSM():
+            with m.State('IDLE'):
+                with m.If(self.i_start):
+                    m.next = 'WAIT_START'
+
+            with m.State('WAIT_START'):
+                m.d.comb += self.o_busy.eq(1)
+                with m.If(fell):
                     m.d.sync += [
-                        busy.eq(0),
-                        shiftCounter.eq(0),
-                        clkDiv.i_enable.eq(0)
+                        counter.eq(1),
+                        edgeCounter.eq(0),
+                        lastEdge.eq(0)
                     ]
+                    m.next = 'MEASURE'
+
+            with m.State('MEASURE'):
+                m.d.comb += self.o_busy.eq(1)
+                m.d.sync += counter.eq(counter + 1)
+
+                with m.If(fell):
+                    m.d.sync += [
+                        edgeCounter.eq(edgeCounter + 1),
+                        lastEdge.eq(counter)
+                    ]
+                    with m.If(edgeCounter == 0):
+                        m.d.sync += firstInterval.eq(interval)
+                    with m.Elif(mismatch):
+                        # outro caractere: recomeca contando desta borda,
+                        # que pode ser o start bit do 0x55
+                        m.d.sync += [
+                            counter.eq(1),
+                            edgeCounter.eq(0),
+                            lastEdge.eq(0)
+                        ]
+                    with m.Elif(edgeCounter == 3):
+                        m.d.sync += divisor.eq(counter << (FRAC_BITS - 3))
+                        m.next = 'WAIT_STOP'
+
+                # linha parada em baixo (break) ou baud baixo demais
+                with m.If(counter == 2**len(counter) - 1):
+                    m.next = 'WAIT_START'
+
+            with m.State('WAIT_STOP'):
+                m.d.comb += self.o_busy.eq(1)
+                with m.If(rx):
+                    m.d.sync += self.o_done.eq(1)
+                    m.next = 'IDLE'
+
+        return m
+
+
+class UartStreamTx(Elaboratable):
+    def __init__(self, depth=512, baud=115200, fractional=False):
+        self.i_data = Signal(8)
+        self.i_valid = Signal()
+        self.o_ready = Signal()
+        self.o_level = Signal(max=depth + 1)
+        self.o_tx = Signal(reset=1)
+
+        self.depth = depth
+        self.baud = baud
+        self.fractional = fractional
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.fifo = fifo = SyncFIFOBuffered(width=8, depth=self.depth)
+        m.submodules.uartTx = uartTx = UartTX(baud=self.baud,
+                                              fractional=self.fractional)
+
+        m.d.comb += [
+            fifo.w_data.eq(self.i_data),
+            fifo.w_en.eq(self.i_valid),
+            self.o_ready.eq(fifo.w_rdy),
+            self.o_level.eq(fifo.level),
+
+            uartTx.i_data.eq(fifo.r_data),
+            uartTx.i_wr.eq(fifo.r_rdy & ~uartTx.o_busy),
+            fifo.r_en.eq(~uartTx.o_busy),
+
+            self.o_tx.eq(uartTx.o_tx)
+        ]
+
+        return m
+
+
+class UartStreamRx(Elaboratable):
+    def __init__(self, depth=512, baud=115200):
+        self.i_rx = Signal(reset=1)
+        self.o_data = Signal(8)
+        self.o_valid = Signal()
+        self.i_ready = Signal()
+        self.o_level = Signal(max=depth + 1)
+        self.o_overflow = Signal()
+        self.o_err = Signal()
+
+        self.depth = depth
+        self.baud = baud
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.fifo = fifo = SyncFIFOBuffered(width=8, depth=self.depth)
+        m.submodules.uartRx = uartRx = UartRx(baud=self.baud)
+
+        m.d.comb += [
+            uartRx.i_rx.eq(self.i_rx),
+            self.o_err.eq(uartRx.o_err),
+
+            fifo.w_data.eq(uartRx.o_data),
+            fifo.w_en.eq(uartRx.o_stb),
+            self.o_overflow.eq(uartRx.o_stb & ~fifo.w_rdy),
+            self.o_level.eq(fifo.level),
+
+            self.o_data.eq(fifo.r_data),
+            self.o_valid.eq(fifo.r_rdy),
+            fifo.r_en.eq(self.i_ready)
+        ]
+
+        return m
+
+
+class UartBridge(Elaboratable):
+    # protocolo: CMD, ADDR_HI, ADDR_LO, LEN (LEN + 1 bytes) e, na escrita,
+    # os dados. Escrita responde ACK, leitura responde os LEN + 1 bytes e
+    # um comando desconhecido responde NAK.
+    CMD_WRITE = 0x01
+    CMD_READ = 0x02
+    CMD_FIXED = 0x10
+    ACK = 0x06
+    NAK = 0x15
+
+    def __init__(self, baud=115200, depth=512):
+        self.i_rx = Signal(reset=1)
+        self.o_tx = Signal(reset=1)
+
+        # barramento wishbone classico, 8 bits de dados
+        self.o_adr = Signal(16)
+        self.o_datW = Signal(8)
+        self.i_datR = Signal(8)
+        self.o_we = Signal()
+        self.o_cyc = Signal()
+        self.o_stb = Signal()
+        self.i_ack = Signal()
+
+        self.baud = baud
+        self.depth = depth
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.streamRx = streamRx = UartStreamRx(depth=self.depth, baud=self.baud)
+        m.submodules.streamTx = streamTx = UartStreamTx(depth=self.depth, baud=self.baud)
+
+        # frame incompleto: volta para IDLE depois de 4 frames sem bytes
+        timeoutCycles = 40 * baudDivisor(platform, self.baud) >> FRAC_BITS
+        m.submodules.timeout = timeout = ClockDivWE(divideBy=timeoutCycles, scalable=False)
+
+        m.d.comb += [
+            streamRx.i_rx.eq(self.i_rx),
+            self.o_tx.eq(streamTx.o_tx),
+            self.o_cyc.eq(self.o_stb)
+        ]
+
+        command = Signal(8)
+        counter = Signal(8)
+        data = Signal(8)
+
+        with m.FSM():
+            with m.State('IDLE'):
+                m.d.comb += streamRx.i_ready.eq(1)
+                with m.If(streamRx.o_valid):
+                    m.d.sync += command.eq(streamRx.o_data)
+                    m.next = 'ADDR_HI'
+
+            with m.State('ADDR_HI'):
+                m.d.comb += [
+                    streamRx.i_ready.eq(1),
+                    timeout.i_enable.eq(~streamRx.o_valid)
+                ]
+                with m.If(streamRx.o_valid):
+                    m.d.sync += self.o_adr[8:].eq(streamRx.o_data)
+                    m.next = 'ADDR_LO'
+                with m.Elif(timeout.o_clk):
+                    m.next = 'IDLE'
+
+            with m.State('ADDR_LO'):
+                m.d.comb += [
+                    streamRx.i_ready.eq(1),
+                    timeout.i_enable.eq(~streamRx.o_valid)
+                ]
+                with m.If(streamRx.o_valid):
+                    m.d.sync += self.o_adr[:8].eq(streamRx.o_data)
+                    m.next = 'LEN'
+                with m.Elif(timeout.o_clk):
+                    m.next = 'IDLE'
+
+            with m.State('LEN'):
+                m.d.comb += [
+                    streamRx.i_ready.eq(1),
+                    timeout.i_enable.eq(~streamRx.o_valid)
+                ]
+                with m.If(streamRx.o_valid):
+                    m.d.sync += counter.eq(streamRx.o_data)
+                    with m.Switch(command):
+                        with m.Case(self.CMD_WRITE, self.CMD_WRITE | self.CMD_FIXED):
+                            m.next = 'WRITE_DATA'
+                        with m.Case(self.CMD_READ, self.CMD_READ | self.CMD_FIXED):
+                            m.next = 'READ_BUS'
+                        with m.Default():
+                            m.next = 'NAK'
+                with m.Elif(timeout.o_clk):
+                    m.next = 'IDLE'
+
+            with m.State('WRITE_DATA'):
+                m.d.comb += [
+                    streamRx.i_ready.eq(1),
+                    timeout.i_enable.eq(~streamRx.o_valid)
+                ]
+                with m.If(streamRx.o_valid):
+                    m.d.sync += self.o_datW.eq(streamRx.o_data)
+                    m.next = 'WRITE_BUS'
+                with m.Elif(timeout.o_clk):
+                    m.next = 'IDLE'
+
+            with m.State('WRITE_BUS'):
+                m.d.comb += [
+                    self.o_stb.eq(1),
+                    self.o_we.eq(1)
+                ]
+                with m.If(self.i_ack):
+                    with m.If(~command[4]):
+                        m.d.sync += self.o_adr.eq(self.o_adr + 1)
+                    m.d.sync += counter.eq(counter - 1)
+                    with m.If(counter == 0):
+                        m.next = 'ACK'
+                    with m.Else():
+                        m.next = 'WRITE_DATA'
+
+            with m.State('READ_BUS'):
+                m.d.comb += self.o_stb.eq(1)
+                with m.If(self.i_ack):
+                    m.d.sync += data.eq(self.i_datR)
+                    m.next = 'READ_SEND'
+
+            with m.State('READ_SEND'):
+                m.d.comb += [
+                    streamTx.i_data.eq(data),
+                    streamTx.i_valid.eq(1)
+                ]
+                with m.If(streamTx.o_ready):
+                    with m.If(~command[4]):
+                        m.d.sync += self.o_adr.eq(self.o_adr + 1)
+                    m.d.sync += counter.eq(counter - 1)
+                    with m.If(counter == 0):
+                        m.next = 'IDLE'
+                    with m.Else():
+                        m.next = 'READ_BUS'
+
+            with m.State('ACK'):
+                m.d.comb += [
+                    streamTx.i_data.eq(self.ACK),
+                    streamTx.i_valid.eq(1)
+                ]
+                with m.If(streamTx.o_ready):
+                    m.next = 'IDLE'
+
+            with m.State('NAK'):
+                m.d.comb += [
+                    streamTx.i_data.eq(self.NAK),
+                    streamTx.i_valid.eq(1)
+                ]
+                with m.If(streamTx.o_ready):
                     m.next = 'IDLE'
 
         return m
 
 
+class BusRam(Elaboratable):
+    def __init__(self, depth=1024):
+        self.i_adr = Signal(max=depth)
+        self.i_datW = Signal(8)
+        self.o_datR = Signal(8)
+        self.i_we = Signal()
+        self.i_stb = Signal()
+        self.o_ack = Signal()
+
+        self.depth = depth
+
+    def elaborate(self, platform):
+        m = Module()
+
+        memory = Memory(width=8, depth=self.depth)
+        m.submodules.readPort = readPort = memory.read_port(transparent=False)
+        m.submodules.writePort = writePort = memory.write_port()
+
+        m.d.comb += [
+            readPort.addr.eq(self.i_adr),
+            readPort.en.eq(1),
+            self.o_datR.eq(readPort.data),
+
+            writePort.addr.eq(self.i_adr),
+            writePort.data.eq(self.i_datW),
+            writePort.en.eq(self.i_stb & self.i_we & ~self.o_ack)
+        ]
+
+        # a leitura sincrona fica pronta no ciclo seguinte
+        m.d.sync += self.o_ack.eq(self.i_stb & ~self.o_ack)
+
+        return m
+
+
 class UartLed(Elaboratable):
-    def __init__(self):
+    def __init__(self, fractional=False, timebase=None):
         self.i_signal = Signal()
         self.o_led = Signal()
 
+        self.fractional = fractional
+        self.tick = timebase.tick(100) if timebase != None else None
+
     def elaborate(self, platform):
         m = Module()
 
-        m.submodules.clkDiv = clkDiv = ClockDivWE(targetFreq=100)
+        if (self.tick is not None):
+            # o tick de 100Hz e livre e pode cair no meio de um byte: apaga
+            # so no segundo tick depois da linha voltar para 1, assim o led
+            # fica aceso entre 10 e 20ms, nunca so um bit
+            ticks = Signal(2)
+            with m.If(~self.i_signal):
+                m.d.sync += [
+                    self.o_led.eq(1),
+                    ticks.eq(0)
+                ]
+            with m.Elif(self.tick & self.o_led):
+                with m.If(ticks == 1):
+                    m.d.sync += self.o_led.eq(0)
+                m.d.sync += ticks.eq(ticks + 1)
+
+            return m
+
+        if (self.fractional):
+            m.submodules.clkDiv = clkDiv = ClockDivNCO(targetFreq=100)
+        else:
+            m.submodules.clkDiv = clkDiv = ClockDivWE(targetFreq=100)
 
         with m.If(~self.i_signal):
             m.d.sync += [
@@ -149,7 +657,7 @@ class UartLed(Elaboratable):
 
 
 class HelloWorld(Elaboratable):
-    def __init__(self, platform=None):
+    def __init__(self, platform=None, baud=115200, fractional=False):
         if (platform != None):
             self.o_tx = platform.request('uart').tx
             self.o_txLed = platform.request('led', 0)
@@ -157,12 +665,20 @@ class HelloWorld(Elaboratable):
             self.o_tx = Signal()
             self.o_txLed = Signal()
 
+        self.baud = baud
+        self.fractional = fractional
+
     def elaborate(self, platform):
         m = Module()
 
-        m.submodules.uartTx = uartTx = UartTX()
-        m.submodules.txLed = txLed = UartLed()
-        m.submodules.clkDiv = clkDiv = ClockDivWE(targetFreq=1)
+        m.submodules.uartTx = uartTx = UartTX(baud=self.baud,
+                                              fractional=self.fractional)
+        m.submodules.txLed = txLed = UartLed(fractional=self.fractional)
+
+        if (self.fractional):
+            m.submodules.clkDiv = clkDiv = ClockDivNCO(targetFreq=1)
+        else:
+            m.submodules.clkDiv = clkDiv = ClockDivWE(targetFreq=1)
 
         m.d.comb += [
             self.o_tx.eq(uartTx.o_tx),
@@ -187,14 +703,13 @@ class HelloWorld(Elaboratable):
             ord(' ')
         ])
 
-        with m.If((~uartTx.o_busy) & (~uartTx.i_wr) & (charCounter <= 12)):
-            m.d.sync += [
+        with m.If(charCounter <= 12):
+            m.d.comb += [
                 uartTx.i_data.eq(helloString[charCounter]),
-                uartTx.i_wr.eq(1),
-                charCounter.eq(charCounter + 1)
+                uartTx.i_wr.eq(1)
             ]
-        with m.Elif(uartTx.o_busy):
-            m.d.sync += uartTx.i_wr.eq(0)
+            with m.If(~uartTx.o_busy):
+                m.d.sync += charCounter.eq(charCounter + 1)
         with m.Elif(clkDiv.o_clk):
             m.d.sync += [
                 clkDiv.i_enable.eq(0),
@@ -207,7 +722,8 @@ class HelloWorld(Elaboratable):
 
 
 class Main(Elaboratable):
-    def __init__(self, platform=None):
+    def __init__(self, platform=None, baud=115200, fractional=False, autoBaud=False,
+                 delayed=False, depth=512):
 
         if (platform != None):
             uart = platform.request('uart')
@@ -221,16 +737,41 @@ class Main(Elaboratable):
             self.o_txLed = Signal()
             self.o_rxLed = Signal()
 
+        self.baud = baud
+        self.fractional = fractional
+        self.autoBaud = autoBaud
+        self.delayed = delayed
+        self.depth = depth
+
     def elaborate(self, platform):
         m = Module()
 
-        m.submodules.uartTx = uartTx = UartTX()
-        m.submodules.uartRx = uartRx = UartRx()
-
-        m.submodules.txLed = txLed = UartLed()
-        m.submodules.rxLed = rxLed = UartLed()
+        # todos os ticks (baud, leds, espera de um segundo) saem da mesma cascata
+        m.submodules.timebase = timebase = Timebase()
+
+        m.submodules.uartTx = uartTx = UartTX(baud=self.baud,
+                                              fractional=self.fractional,
+                                              runtimeBaud=self.autoBaud,
+                                              timebase=timebase)
+        uartRx = UartRx(baud=self.baud, runtimeBaud=self.autoBaud)
+
+        if (self.autoBaud):
+            # um break (erro de frame) rearma a deteccao: o host manda o
+            # break, troca de baud e manda 0x55
+            m.submodules.autoBaud = autoBaud = UartAutoBaud(baud=self.baud)
+            m.submodules.uartRx = ResetInserter(autoBaud.o_busy)(uartRx)
+
+            m.d.comb += [
+                autoBaud.i_rx.eq(self.i_rx),
+                autoBaud.i_start.eq(uartRx.o_err),
+                uartRx.i_divisor.eq(autoBaud.o_divisor),
+                uartTx.i_divisor.eq(autoBaud.o_divisor)
+            ]
+        else:
+            m.submodules.uartRx = uartRx
 
-        m.submodules.oneSecTimer = oneSecTimer = ClockDivWE(targetFreq=1)
+        m.submodules.txLed = txLed = UartLed(timebase=timebase)
+        m.submodules.rxLed = rxLed = UartLed(timebase=timebase)
 
         m.d.comb += [
             self.o_tx.eq(uartTx.o_tx),
@@ -243,129 +784,529 @@ class Main(Elaboratable):
             rxLed.i_signal.eq(self.i_rx)
         ]
 
-        # recebe o byte
-        # aguarda um segundo
-        # envia o byte recebido
+        if (self.delayed):
+            # recebe o byte
+            # aguarda um segundo
+            # envia o byte recebido
 
-        buffer = Signal(8)
+            # um segundo = 1000 ticks de 1ms, contador de 10 bits
+            msTick = timebase.tick(1000)
+            msCounter = Signal(max=1000)
+            buffer = Signal(8)
 
-        with m.FSM():
-            with m.State('IDLE'):
-                with m.If(uartRx.o_stb):
-                    m.d.sync += [
-                        oneSecTimer.i_enable.eq(1),
-                        buffer.eq(uartRx.o_data)
-                    ]
-                    m.next = 'WAIT'
+            with m.FSM():
+                with m.State('IDLE'):
+                    with m.If(uartRx.o_stb):
+                        m.d.sync += [
+                            msCounter.eq(0),
+                            buffer.eq(uartRx.o_data)
+                        ]
+                        m.next = 'WAIT'
+
+                with m.State('WAIT'):
+                    with m.If(msTick):
+                        m.d.sync += msCounter.eq(msCounter + 1)
+                        with m.If(msCounter == 999):
+                            m.d.sync += [
+                                uartTx.i_data.eq(buffer),
+                                uartTx.i_wr.eq(1)
+                            ]
+                            m.next = 'START_SEND'
+
+                with m.State('START_SEND'):
+                    m.d.sync += uartTx.i_wr.eq(0)
+                    m.next = 'SENDING'
+
+                with m.State('SENDING'):
+                    with m.If(~uartTx.o_busy):
+                        m.next = 'IDLE'
 
-            with m.State('WAIT'):
-                with m.If(oneSecTimer.o_clk):
-                    m.d.sync += [
-                        oneSecTimer.i_enable.eq(0),
-                        uartTx.i_data.eq(buffer),
-                        uartTx.i_wr.eq(1)
-                    ]
-                    m.next = 'START_SEND'
+        else:
+            # eco direto: cada byte recebido passa pela fila e sai pelo
+            # UartTX assim que ele pode aceitar
+            m.submodules.fifo = fifo = SyncFIFOBuffered(width=8, depth=self.depth)
 
-            with m.State('START_SEND'):
-                m.d.sync += uartTx.i_wr.eq(0)
-                m.next = 'SENDING'
+            m.d.comb += [
+                fifo.w_data.eq(uartRx.o_data),
+                fifo.w_en.eq(uartRx.o_stb),
 
-            with m.State('SENDING'):                
-                with m.If(~uartTx.o_busy):
-                    m.next = 'IDLE'
+                uartTx.i_data.eq(fifo.r_data),
+                uartTx.i_wr.eq(fifo.r_rdy),
+                fifo.r_en.eq(~uartTx.o_busy)
+            ]
+
+        return m
+
+
+class BridgeMain(Elaboratable):
+    def __init__(self, platform=None, baud=115200):
+        if (platform != None):
+            uart = platform.request('uart')
+            self.o_tx = uart.tx
+            self.i_rx = uart.rx
+            self.o_greenLed = platform.request('led', 0)
+            self.o_orangeLed = platform.request('led', 1)
+        else:
+            self.o_tx = Signal()
+            self.i_rx = Signal()
+            self.o_greenLed = Signal()
+            self.o_orangeLed = Signal()
+
+        self.baud = baud
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.bridge = bridge = UartBridge(baud=self.baud)
+        m.submodules.ram = ram = BusRam(depth=1024)
+
+        # 0x0000-0x03FF: ram, 0x8000: registro dos leds. o resto do espaco
+        # responde com ack: leitura 0, escrita ignorada
+        ledRegister = Signal(2)
+        regAck = Signal()
+        ramSelected = Signal()
+        ledSelected = Signal()
+
+        m.d.comb += [
+            bridge.i_rx.eq(self.i_rx),
+            self.o_tx.eq(bridge.o_tx),
+
+            ramSelected.eq(bridge.o_adr < ram.depth),
+            ledSelected.eq(bridge.o_adr == 0x8000),
+
+            ram.i_adr.eq(bridge.o_adr),
+            ram.i_datW.eq(bridge.o_datW),
+            ram.i_we.eq(bridge.o_we),
+            ram.i_stb.eq(bridge.o_stb & ramSelected),
+
+            bridge.i_datR.eq(Mux(ramSelected, ram.o_datR,
+                                 Mux(ledSelected, ledRegister, 0))),
+            bridge.i_ack.eq(Mux(ramSelected, ram.o_ack, regAck)),
+
+            self.o_greenLed.eq(ledRegister[0]),
+            self.o_orangeLed.eq(ledRegister[1])
+        ]
+
+        m.d.sync += regAck.eq(bridge.o_stb & ~ramSelected & ~regAck)
+        with m.If(bridge.o_stb & bridge.o_we & ledSelected & ~regAck):
+            m.d.sync += ledRegister.eq(bridge.o_datW)
 
         return m
 
 
 def parse_args():
-    parser = ArgumentParser()
-    p_action = parser.add_subparsers(dest='action')
+    parser, p_action = designParser()
     p_action.add_parser('simulatetx')
-    p_action.add_parser('simulaterx')
-    p_action.add_parser('simulatem')
-    p_action.add_parser('build')
-    p_program = p_action.add_parser('program')
-
-    p_program.add_argument('-f', '--flash',
-                           help='save the bitstream in flash',
-                           action='store_true')
+    p_simulaterx = p_action.add_parser('simulaterx')
+    p_simulatem = p_action.add_parser('simulatem')
+    p_simulatehello = p_action.add_parser('simulatehello')
+    p_action.add_parser('simulatestream')
+    p_action.add_parser('simulateautobaud')
+    p_action.add_parser('simulatebridge')
+    p_build = p_action.choices['build']
+    p_program = p_action.choices['program']
+
+    for p in (p_simulatem, p_build, p_program):
+        p.add_argument('-d', '--delayed',
+                       help='echo each byte after one second',
+                       action='store_true')
+
+    p_simulatem.add_argument('-s', '--scale', type=int, default=0,
+                             help='simulate at the board clock with timers '
+                                  'this many times faster')
+    p_simulatem.add_argument('-n', '--count', type=int, default=0,
+                             help='echo this many random bytes')
+
+    p_simulatehello.add_argument('-s', '--scale', type=int, default=1000,
+                                 help='compare against a run with timers '
+                                      'this many times faster')
+
+    p_simulaterx.add_argument('-r', '--baud', type=int, default=0,
+                              help='receive at this baud rate from the board clock '
+                                   'instead of 16 cycles per bit')
+    p_simulaterx.add_argument('-t', '--drift', type=float, default=0,
+                              help='sender baud rate error in percent')
+    p_simulaterx.add_argument('-n', '--count', type=int, default=0,
+                              help='also receive this many random bytes')
+
+    for p in (p_build, p_program):
+        p.add_argument('-b', '--bridge',
+                       help='build the uart to bus bridge instead of the echo',
+                       action='store_true')
+        p.add_argument('-r', '--baud', type=int, default=115200,
+                       help='baud rate, up to 3000000 from the board clock')
+        p.add_argument('--fractional',
+                       help='fractional baud divider (exact rate at any baud)',
+                       action='store_true')
+        p.add_argument('--autobaud',
+                       help='detect the baud rate from a break followed by 0x55',
+                       action='store_true')
+
+    addTraceArgs(p_action)
 
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
-    platform = FpgaDevBoard()
 
-    if args.action == 'build':
-        platform.build(Main(platform=platform))
+    def top(platform):
+        if args.bridge:
+            return BridgeMain(platform=platform, baud=args.baud)
+        return Main(platform=platform, baud=args.baud, fractional=args.fractional,
+                    autoBaud=args.autobaud, delayed=args.delayed)
 
-    elif args.action == 'program':
-        if args.flash:
-            platform.build(Main(platform=platform), do_program=True,
-                           program_opts={"flash": True})
-        else:
-            platform.build(Main(platform=platform), do_program=True,
-                           program_opts={"flash": False})
+    boardAction(args, top)
 
-    elif args.action == 'simulatetx':
+    if args.action == 'simulatetx':
         m = Module()
         m.submodules.main = uartTx = UartTX()
 
-        i_wr = Signal()
-        m.d.comb += uartTx.i_wr.eq(i_wr)
-
         sim = Simulator(m)
         sim.add_clock(1e-6)
 
+        bfm = UartBfm(bitCycles=16)
+        testBytes = [0x0F, 0x55, 0x00, 0xFF]
+
         def process():
-            yield Delay(5e-6)
-            yield uartTx.i_data.eq(0b00001111)
-            yield i_wr.eq(1)
-            yield Delay(2e-6)
-            yield i_wr.eq(0)
-            yield Delay(1e-3)
+            yield
+            for byte in testBytes:
+                yield uartTx.i_data.eq(byte)
+                yield uartTx.i_wr.eq(1)
+                yield Settle()
+                while (yield uartTx.o_busy):
+                    yield
+                    yield Settle()
+                yield
+            yield uartTx.i_wr.eq(0)
+
+        def check():
+            frameCycles = 10 * bfm.bitCycles
+
+            received = yield from bfm.receive(uartTx.o_tx, 1, timeout=frameCycles)
+            firstFrame = bfm.cycles
+            received += yield from bfm.receive(uartTx.o_tx, len(testBytes) - 1,
+                                               timeout=frameCycles)
+
+            # frames colados: um start bit a cada 10 bits, sem idle
+            assert bfm.cycles - firstFrame <= (len(testBytes) - 1) * frameCycles + 2, \
+                "idle between frames"
+            assert received == testBytes, received
+            print("sent", [hex(b) for b in received], "in",
+                  len(testBytes) * frameCycles, "cycles")
 
         sim.add_sync_process(process)
-        with sim.write_vcd("test.vcd", "test.gtkw"):
+        sim.add_sync_process(check)
+        with traceVcd(sim, args):
             sim.run()
 
     elif args.action == 'simulaterx':
         m = Module()
         rx = Signal(reset=1)
-        m.submodules.main = main = UartRx()
+        testBytes = [0x55, 0xA5, 0x00, 0xFF]
+        testBytes += [random.randrange(256) for n in range(args.count)]
+
+        m.submodules.main = main = UartRx(baud=args.baud or 115200)
         m.d.comb += main.i_rx.eq(rx)
-        sim = Simulator(m)
-        sim.add_clock(1e-6)
+
+        if (args.baud):
+            # no clock da placa, com o transmissor args.drift% fora do baud
+            simPlatform = SimPlatform()
+            sim = simPlatform.simulator(m)
+            clkFrequency = simPlatform.default_clk_frequency
+            bfm = UartBfm(bitCycles=clkFrequency / (args.baud * (1 + args.drift / 100)),
+                          clkPeriod=1 / clkFrequency)
+            print("{} baud, {:.2f} cycles per bit".format(args.baud, bfm.bitCycles))
+        else:
+            sim = Simulator(m)
+            sim.add_clock(1e-6)
+
+            # sem platform cada bit dura `oversampling` ciclos
+            bfm = UartBfm(bitCycles=main.oversampling)
 
         def process():
-            yield Delay(1e-5)
-            yield rx.eq(0)
-            yield Delay(4e-5)
-            yield rx.eq(1)
-            yield Delay(4e-2)
+            yield from bfm.wait(10)
+            yield from bfm.send(rx, testBytes)
+
+        def check():
+            received = []
+            while len(received) < len(testBytes):
+                if (yield main.o_err):
+                    raise AssertionError("framing error")
+                if (yield main.o_stb):
+                    received.append((yield main.o_data))
+                yield
+            assert received == testBytes, received
+            print("received", len(received), "bytes:", [hex(b) for b in received[:8]])
 
         sim.add_sync_process(process)
-        with sim.write_vcd("test.vcd", "test.gtkw"):
+        sim.add_sync_process(check)
+        with traceVcd(sim, args):
             sim.run()
 
 
     elif args.action == 'simulatem':
         m = Module()
         rx = Signal(reset=1)
-        m.submodules.main = main = Main()
+        m.submodules.main = main = Main(delayed=args.delayed)
         m.d.comb += main.i_rx.eq(rx)
+
+        if (args.scale):
+            simPlatform = SimPlatform(timeScale=args.scale)
+            sim = simPlatform.simulator(m)
+            clkPeriod = 1 / simPlatform.default_clk_frequency
+            bitCycles = baudDivisor(simPlatform, 115200) / (1 << FRAC_BITS)
+            secondCycles = int(simPlatform.default_clk_frequency) // args.scale
+        else:
+            sim = Simulator(m)
+            sim.add_clock(1e-6)
+            clkPeriod = 1e-6
+            bitCycles = 16
+            # sem platform a Timebase conta um clock de SIM_CLK_FREQUENCY
+            secondCycles = SIM_CLK_FREQUENCY
+
+        # no modo delayed um byte que chega durante a espera e perdido
+        gapCycles = secondCycles + int(2 * 10 * bitCycles) if args.delayed else 0
+
+        if (args.count):
+            random.seed(args.count)
+            testBytes = [random.getrandbits(8) for n in range(args.count)]
+        else:
+            testBytes = [0x31, 0x32, 0x33]
+
+        driver = UartBfm(bitCycles, clkPeriod)
+        monitor = UartBfm(bitCycles, clkPeriod)
+
+        def process():
+            yield from driver.wait(10)
+            yield from driver.send(rx, testBytes, gapCycles)
+
+        def check():
+            received = yield from monitor.receive(main.o_tx, len(testBytes))
+            assert received == testBytes, received
+            if (len(received) <= 16):
+                print("echoed", [hex(b) for b in received], end=" ")
+            else:
+                print("echoed", len(received), "bytes", end=" ")
+            print("after", monitor.cycles, "cycles",
+                  "({:.3f} ms)".format(monitor.cycles * clkPeriod * 1e3))
+
+        sim.add_sync_process(process)
+        sim.add_sync_process(check)
+        with traceVcd(sim, args):
+            sim.run()
+
+
+    elif args.action == 'simulatehello':
+        assert args.scale > 1, "--scale must be above 1"
+        # clock de 4 * 115200: um segundo real ainda cabe na simulacao. o
+        # ClockDivWE conta de 0 a divideBy, entao cada bit dura 5 ciclos
+        clkFrequency = 4 * 115200
+        bitCycles = clkFrequency // 115200 + 1
+        message = [ord(c) for c in 'Hello World! ']
+
+        def helloRun(scale, vcd):
+            # duas mensagens: bytes recebidos e ciclos entre o fim de cada byte
+            m = Module()
+            m.submodules.main = main = HelloWorld()
+            sim = SimPlatform(timeScale=scale, clkFrequency=clkFrequency).simulator(m)
+            monitor = UartBfm(bitCycles=bitCycles, clkPeriod=1 / clkFrequency)
+            received = []
+            ends = []
+
+            def check():
+                # o primeiro frame sai logo no segundo ciclo
+                yield from monitor.wait(1)
+                for n in range(2 * len(message)):
+                    received.extend((yield from monitor.receive(main.o_tx, 1)))
+                    ends.append(monitor.cycles)
+
+            sim.add_sync_process(check)
+            if (vcd):
+                with traceVcd(sim, args):
+                    sim.run()
+            else:
+                sim.run()
+            return received, [b - a for a, b in zip(ends, ends[1:])]
+
+        received, spacing = helloRun(1, False)
+        scaledReceived, scaledSpacing = helloRun(args.scale, True)
+
+        # mesmos bytes e mesma distancia entre os bytes de uma mensagem; so
+        # a pausa do timer de um segundo entre as mensagens encolhe
+        assert received == scaledReceived == 2 * message, scaledReceived
+        pause = len(message) - 1
+        for n, (cycles, scaled) in enumerate(zip(spacing, scaledSpacing)):
+            if (n != pause):
+                assert abs(cycles - scaled) <= 2, (n, cycles, scaled)
+        # pausa = timer + atraso fixo (o timer comeca com bytes ainda na
+        # linha) e com a escala so o timer encolhe: timer = 1 s de clock
+        timer = (spacing[pause] - scaledSpacing[pause]) * args.scale / (args.scale - 1)
+        offset = spacing[pause] - timer
+        assert abs(timer - clkFrequency) <= bitCycles, (timer, clkFrequency)
+        assert abs(offset) <= 10 * bitCycles, offset
+        print("sent", repr(bytes(received).decode()), "pause of",
+              spacing[pause], "cycles,", scaledSpacing[pause], "scaled",
+              "(timer {:.0f}, offset {:.0f})".format(timer, offset))
+
+    elif args.action == 'simulatestream':
+        m = Module()
+        rx = Signal(reset=1)
+        m.submodules.streamTx = streamTx = UartStreamTx(depth=16)
+        m.submodules.streamRx = streamRx = UartStreamRx(depth=4)
+        m.d.comb += streamRx.i_rx.eq(rx)
+        sim = Simulator(m)
+        sim.add_clock(1e-6)
+
+        bfm = UartBfm(bitCycles=16)
+        testBytes = [0x10, 0x20, 0x30, 0x40, 0x50, 0x60]
+        overflows = []
+
+        def txProcess():
+            # rajada de bytes, um por ciclo enquanto houver espaco
+            for byte in testBytes:
+                yield streamTx.i_data.eq(byte)
+                yield streamTx.i_valid.eq(1)
+                yield
+                while not (yield streamTx.o_ready):
+                    yield
+            yield streamTx.i_valid.eq(0)
+            yield
+            assert (yield streamTx.o_level) > 0
+            while (yield streamTx.o_level) != 0:
+                yield
+
+        def txMonitor():
+            # a rajada sai pela linha em ordem, sem perder nem repetir byte
+            # na passagem da fila para o UartTX
+            monitor = UartBfm(bitCycles=16)
+            yield from monitor.wait(1)
+            sent = yield from monitor.receive(streamTx.o_tx, len(testBytes))
+            assert sent == testBytes, sent
+            print("sent", [hex(b) for b in sent])
+
+        def overflowProcess():
+            yield Passive()
+            while True:
+                if (yield streamRx.o_overflow):
+                    overflows.append(1)
+                yield
+
+        def rxProcess():
+            # ninguem consome a fila: o quinto byte em diante transborda
+            yield from bfm.send(rx, testBytes)
+            yield from bfm.wait(bfm.bitCycles)
+
+            assert (yield streamRx.o_level) == 4
+            assert len(overflows) == 2, overflows
+
+            received = []
+            yield streamRx.i_ready.eq(1)
+            yield
+            while (yield streamRx.o_valid):
+                received.append((yield streamRx.o_data))
+                yield
+            assert received == testBytes[:4], received
+            print("received", [hex(b) for b in received])
+
+        sim.add_sync_process(txProcess)
+        sim.add_sync_process(txMonitor)
+        sim.add_sync_process(overflowProcess)
+        sim.add_sync_process(rxProcess)
+        with traceVcd(sim, args):
+            sim.run()
+
+    elif args.action == 'simulateautobaud':
+        m = Module()
+        rx = Signal(reset=1)
+        m.submodules.autoBaud = autoBaud = UartAutoBaud()
+        uartRx = UartRx(runtimeBaud=True)
+        m.submodules.uartRx = ResetInserter(autoBaud.o_busy)(uartRx)
+        m.d.comb += [
+            autoBaud.i_rx.eq(rx),
+            uartRx.i_rx.eq(rx),
+            uartRx.i_divisor.eq(autoBaud.o_divisor)
+        ]
         sim = Simulator(m)
         sim.add_clock(1e-6)
 
+        # o divisor comeca em 16 ciclos por bit; o host passa para 37
+        bfm = UartBfm(bitCycles=37)
+        testBytes = [0x55, 0x12, 0xEF]
+
         def process():
-            yield Delay(1e-5)
-            yield rx.eq(0)
-            yield Delay(4e-5)
-            yield rx.eq(1)
-            yield Delay(4e-3)
+            yield autoBaud.i_start.eq(1)
+            yield
+            yield autoBaud.i_start.eq(0)
+            yield from bfm.wait(10)
+
+            # um caractere que nao e 0x55 nao muda o divisor
+            divisor = yield autoBaud.o_divisor
+            yield from bfm.send(rx, [0x0F])
+            yield from bfm.wait(3 * bfm.bitCycles)
+            assert (yield autoBaud.o_divisor) == divisor
+            assert (yield autoBaud.o_busy)
+
+            yield from bfm.send(rx, [0x55])
+            assert (yield autoBaud.o_divisor) >> FRAC_BITS == bfm.bitCycles, \
+                (yield autoBaud.o_divisor) / (1 << FRAC_BITS)
+
+            yield from bfm.send(rx, testBytes)
+            yield from bfm.wait(bfm.bitCycles)
+
+        def check():
+            received = []
+            while len(received) < len(testBytes):
+                if (yield uartRx.o_stb):
+                    received.append((yield uartRx.o_data))
+                yield
+            assert received == testBytes, received
+            print("divisor", (yield autoBaud.o_divisor) / (1 << FRAC_BITS),
+                  "received", [hex(b) for b in received])
+
+        sim.add_sync_process(process)
+        sim.add_sync_process(check)
+        with traceVcd(sim, args):
+            sim.run()
+
+    elif args.action == 'simulatebridge':
+        m = Module()
+        rx = Signal(reset=1)
+        m.submodules.main = main = BridgeMain()
+        m.d.comb += main.i_rx.eq(rx)
+        sim = Simulator(m)
+        sim.add_clock(1e-6)
+
+        driver = UartBfm(bitCycles=16)
+        monitor = UartBfm(bitCycles=16)
+        payload = [0xDE, 0xAD, 0xBE, 0xEF, 0x42]
+        requests = [
+            [UartBridge.CMD_WRITE, 0x00, 0x10, len(payload) - 1] + payload,
+            [UartBridge.CMD_READ, 0x00, 0x10, len(payload) - 1],
+            [UartBridge.CMD_WRITE | UartBridge.CMD_FIXED, 0x80, 0x00, 1, 0x01, 0x02],
+            [UartBridge.CMD_READ | UartBridge.CMD_FIXED, 0x80, 0x00, 0],
+            # fora da ram e do registro dos leds: le 0, sem repetir 0x0010 e 0x8000
+            [UartBridge.CMD_WRITE, 0x04, 0x10, 0, 0x55],
+            [UartBridge.CMD_READ, 0x04, 0x10, 0],
+            [UartBridge.CMD_READ, 0x00, 0x10, 0],
+            [UartBridge.CMD_READ | UartBridge.CMD_FIXED, 0x80, 0x01, 0],
+            [0x7F, 0x00, 0x00, 0]
+        ]
+        expected = [UartBridge.ACK] + payload + [UartBridge.ACK, 0x02] + \
+            [UartBridge.ACK, 0x00, 0xDE, 0x00, UartBridge.NAK]
+
+        def process():
+            yield from driver.wait(10)
+            for request in requests:
+                yield from driver.send(rx, request)
+
+        def check():
+            received = yield from monitor.receive(main.o_tx, len(expected))
+            assert received == expected, received
+            assert (yield main.o_orangeLed) and not (yield main.o_greenLed)
+            print("replies", [hex(b) for b in received])
 
         sim.add_sync_process(process)
-        with sim.write_vcd("test.vcd", "test.gtkw"):
+        sim.add_sync_process(check)
+        with traceVcd(sim, args):
             sim.run()